@@ -4,10 +4,19 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command
 from aiogram.types import Message
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from handlers import token_router
+from browser import browser_manager
+from coin_index import coin_index
+from handlers import ibm_storage, prerenderer, render_queue, token_router
+from http_client import http_clients
+from images import image_pipeline
+from middlewares import ConcurrencyLimitMiddleware
 from service_types import TokenSelection
-from settings import TelegramSettings
+from sessions import SessionFSMStorage, session_store
+from settings import CoinGeckoAPISettings, TelegramSettings, WebhookSettings
+from utils import template_registry
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,8 +24,10 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 telegram_settings = TelegramSettings()
+webhook_settings = WebhookSettings()
+coin_index_task: asyncio.Task | None = None
 
-dp = Dispatcher()
+dp = Dispatcher(storage=SessionFSMStorage(session_store))
 
 
 @dp.message(Command("start"))
@@ -35,11 +46,79 @@ async def help_handler(message: Message) -> None:
     await start_handler(message)
 
 
+async def on_startup() -> None:
+    global coin_index_task
+    template_registry.load_all()
+    http_clients.start()
+    if render_queue.settings.render_worker_mode == "async":
+        await browser_manager.start()
+    render_queue.start()
+    prerenderer.start()
+    coin_index_task = asyncio.create_task(
+        coin_index.run(CoinGeckoAPISettings().coin_gecko_api_key)
+    )
+
+
+async def register_webhook(bot: Bot) -> None:
+    webhook_url = (
+        webhook_settings.webhook_url.rstrip("/") + webhook_settings.webhook_path
+    )
+    await bot.set_webhook(
+        webhook_url,
+        secret_token=webhook_settings.webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"Webhook registered at {webhook_url}")
+
+
+async def on_shutdown() -> None:
+    if coin_index_task is not None:
+        coin_index_task.cancel()
+    await prerenderer.stop()
+    await render_queue.stop()
+    await browser_manager.stop()
+    await http_clients.aclose()
+    ibm_storage.close()
+    image_pipeline.close()
+
+
+def create_dispatcher() -> Dispatcher:
+    dp.include_router(token_router)
+    dp.update.outer_middleware(
+        ConcurrencyLimitMiddleware(telegram_settings.telegram_max_concurrent_updates)
+    )
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
+def run_webhook(bot: Bot) -> None:
+    """Serve updates over HTTP. Several instances can run behind a load balancer;
+    each one re-registers the same webhook URL on startup."""
+    if not webhook_settings.webhook_url:
+        raise ValueError("WEBHOOK_URL must be set when TELEGRAM_MODE is webhook")
+    dp.startup.register(register_webhook)
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=webhook_settings.webhook_secret
+    ).register(app, path=webhook_settings.webhook_path)
+    setup_application(app, dp, bot=bot)
+    web.run_app(
+        app, host=webhook_settings.webhook_host, port=webhook_settings.webhook_port
+    )
+
+
 async def main() -> None:
     bot = Bot(token=telegram_settings.telegram_bot_token)
-    dp.include_router(token_router)
+    create_dispatcher()
+    # A webhook left over from TELEGRAM_MODE=webhook makes getUpdates fail
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if telegram_settings.telegram_mode == "webhook":
+        create_dispatcher()
+        run_webhook(Bot(token=telegram_settings.telegram_bot_token))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+import os
+from contextlib import asynccontextmanager
+from functools import cache
+from pathlib import Path
+from typing import TYPE_CHECKING, AsyncIterator
+
+from playwright.async_api import async_playwright
+
+from logger import get_logger
+from settings import BrowserSettings
+from utils import return_base_dir
+
+if TYPE_CHECKING:
+    from playwright.async_api import (Browser, BrowserContext, Page, Playwright,
+                                      Route)
+
+# Set up logging
+logger = get_logger()
+
+# Rendered HTML is served from this origin through request interception, so pages
+# load without touching the network or object storage
+RENDER_ORIGIN = "https://render.local"
+# CDN scripts the templates load, mapped to vendored copies under static/. Pages
+# uploaded for users keep the CDN URLs, while headless renders get the copy from
+# memory. Without a vendored copy the request goes to the CDN.
+VENDORED_ASSETS = {
+    "https://d3js.org/d3.v7.min.js": "/static/vendor/d3.v7.min.js",
+}
+
+
+@cache
+def _static_assets() -> dict[str, tuple[bytes, str]]:
+    """Files under static/, read once and kept in memory as (body, content type)."""
+    static_dir = Path(return_base_dir()) / "static"
+    assets = {}
+    for path in static_dir.rglob("*"):
+        if path.is_file():
+            content_type = mimetypes.guess_type(path.name)[0]
+            assets[f"/static/{path.relative_to(static_dir).as_posix()}"] = (
+                path.read_bytes(),
+                content_type or "application/octet-stream",
+            )
+    logger.debug(f"Loaded {len(assets)} static assets into memory")
+    return assets
+
+
+def _driver_rss_mb() -> float:
+    """Resident memory of the Playwright driver spawned by this process and of
+    everything under it (chromium), read straight from /proc. Other children, like
+    image or render worker processes, are left out. Returns 0 where /proc is not
+    available."""
+    parents: dict[int, int] = {}
+    rss_pages: dict[int, int] = {}
+    try:
+        entries = os.listdir("/proc")
+    except FileNotFoundError:
+        return 0.0
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing paren
+        fields = stat.rsplit(")", 1)[1].split()
+        parents[int(entry)] = int(fields[1])
+        rss_pages[int(entry)] = int(fields[21])
+
+    children: dict[int, list[int]] = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+
+    stack = [pid for pid in children.get(os.getpid(), []) if _is_driver(pid)]
+    total = 0
+    while stack:
+        pid = stack.pop()
+        total += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf("SC_PAGE_SIZE") / (1024**2)
+
+
+def _is_driver(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return b"run-driver" in f.read()
+    except OSError:
+        return False
+
+
+class _PooledPage:
+    def __init__(self, browser: Browser, context: BrowserContext, page: Page) -> None:
+        self.browser = browser
+        self.context = context
+        self.page = page
+
+
+class BrowserManager:
+    """Long-lived Chromium instance handing out pre-warmed pages from a bounded pool.
+
+    The browser is recycled after `browser_max_pages` pages or once its processes
+    grow past `browser_memory_limit_mb`. Memory is sampled every
+    `browser_memory_check_interval` seconds in the background, so checkouts never
+    scan the process table. Pages still in use on a retired browser are allowed to
+    finish before that browser is closed.
+    """
+
+    def __init__(self, settings: BrowserSettings) -> None:
+        self.settings = settings
+        self._playwright: Playwright | None = None
+        self._browser: Browser | None = None
+        self._idle: list[_PooledPage] = []
+        self._in_use: dict[Browser, int] = {}
+        self._retired: set[Browser] = set()
+        self._slots = asyncio.Semaphore(settings.browser_pool_size)
+        self._lock = asyncio.Lock()
+        self._pages_served = 0
+        self._memory_mb = 0.0
+        self._memory_monitor: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        async with self._lock:
+            await self._start()
+
+    async def _start(self) -> None:
+        if self._browser is not None:
+            return
+        logger.info("Starting Playwright browser manager")
+        for url, path in VENDORED_ASSETS.items():
+            if path not in _static_assets():
+                logger.warning(
+                    f"No vendored copy of {url} at {path}, renders will load it "
+                    "from the CDN"
+                )
+        self._playwright = await async_playwright().start()
+        await self._launch()
+        self._memory_monitor = asyncio.create_task(self._monitor_memory())
+
+    async def _monitor_memory(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.browser_memory_check_interval)
+            if self._retired:
+                # A draining browser still counts towards the driver's memory
+                continue
+            try:
+                self._memory_mb = await asyncio.to_thread(_driver_rss_mb)
+            except Exception as e:
+                logger.debug(f"Could not read browser memory: {str(e)}")
+
+    async def _launch(self) -> None:
+        logger.debug("Launching Playwright browser")
+        self._browser = await self._playwright.chromium.launch(
+            channel="chromium", headless=True
+        )
+        self._in_use[self._browser] = 0
+        self._pages_served = 0
+        self._memory_mb = 0.0
+        for _ in range(self.settings.browser_pool_size):
+            self._idle.append(await self._new_page())
+        logger.info(
+            "Browser launched with %s pre-warmed pages", self.settings.browser_pool_size
+        )
+
+    async def _new_page(self) -> _PooledPage:
+        context = await self._browser.new_context(
+            viewport={
+                "width": self.settings.browser_viewport_width,
+                "height": self.settings.browser_viewport_height,
+            }
+        )
+        page = await context.new_page()
+        return _PooledPage(self._browser, context, page)
+
+    def _should_recycle(self) -> bool:
+        if not self._browser.is_connected():
+            logger.warning("Browser disconnected, relaunching")
+            return True
+        if self._pages_served >= self.settings.browser_max_pages:
+            logger.info("Browser served %s pages, recycling", self._pages_served)
+            return True
+        if self._memory_mb > self.settings.browser_memory_limit_mb:
+            logger.info("Browser memory at %.0fmb, recycling", self._memory_mb)
+            return True
+        return False
+
+    async def _recycle(self) -> None:
+        old_browser = self._browser
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._close_page(pooled)
+        self._retired.add(old_browser)
+        await self._launch()
+        await self._close_browser_if_drained(old_browser)
+
+    async def _close_page(self, pooled: _PooledPage) -> None:
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser context: {str(e)}")
+
+    async def _close_browser_if_drained(self, browser: Browser) -> None:
+        if browser not in self._retired or self._in_use.get(browser, 0) > 0:
+            return
+        self._retired.discard(browser)
+        self._in_use.pop(browser, None)
+        logger.debug("Closing retired browser")
+        try:
+            await browser.close()
+        except Exception as e:
+            logger.debug(f"Error closing retired browser: {str(e)}")
+
+    async def _checkout(self) -> _PooledPage:
+        async with self._lock:
+            await self._start()
+            if self._should_recycle():
+                await self._recycle()
+            pooled = self._idle.pop() if self._idle else await self._new_page()
+            self._in_use[pooled.browser] += 1
+            self._pages_served += 1
+            return pooled
+
+    async def _checkin(self, pooled: _PooledPage, reusable: bool) -> None:
+        async with self._lock:
+            self._in_use[pooled.browser] -= 1
+            if (
+                reusable
+                and pooled.browser is self._browser
+                and not pooled.page.is_closed()
+            ):
+                try:
+                    await pooled.page.goto("about:blank")
+                    self._idle.append(pooled)
+                    return
+                except Exception as e:
+                    logger.debug(f"Could not reset pooled page: {str(e)}")
+            await self._close_page(pooled)
+            await self._close_browser_if_drained(pooled.browser)
+
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """Borrow a page from the pool, waiting if every page is in use."""
+        async with self._slots:
+            pooled = await self._checkout()
+            reusable = False
+            try:
+                yield pooled.page
+                reusable = True
+            finally:
+                await self._checkin(pooled, reusable)
+
+    @asynccontextmanager
+    async def rendered_page(
+        self, html: str, assets: dict[str, tuple[bytes, str]] | None = None
+    ) -> AsyncIterator[Page]:
+        """Borrow a page with `html` loaded in-process.
+
+        The document is served at RENDER_ORIGIN, along with static/ and any extra
+        `assets` (path -> (body, content type)), all from memory. Requests for
+        VENDORED_ASSETS are answered with the vendored copies, when present.
+        """
+        routes = {"/": (html.encode(), "text/html; charset=utf-8")}
+        routes.update(_static_assets())
+        routes.update(assets or {})
+
+        async def handle(route: Route) -> None:
+            path = route.request.url.removeprefix(RENDER_ORIGIN).split("?")[0]
+            if path not in routes:
+                logger.warning(f"No in-memory asset for {path}")
+                await route.fulfill(status=404)
+                return
+            body, content_type = routes[path]
+            await route.fulfill(status=200, body=body, content_type=content_type)
+
+        async def handle_vendored(route: Route) -> None:
+            url = route.request.url
+            path = VENDORED_ASSETS[url]
+            if path not in routes:
+                await route.continue_()
+                return
+            body, content_type = routes[path]
+            await route.fulfill(status=200, body=body, content_type=content_type)
+
+        async with self.page() as page:
+            await page.route(f"{RENDER_ORIGIN}/**", handle)
+            for url in VENDORED_ASSETS:
+                await page.route(url, handle_vendored)
+            try:
+                await page.goto(f"{RENDER_ORIGIN}/", timeout=60000)
+                yield page
+            finally:
+                await page.unroute(f"{RENDER_ORIGIN}/**", handle)
+                for url in VENDORED_ASSETS:
+                    await page.unroute(url, handle_vendored)
+
+    async def stop(self) -> None:
+        async with self._lock:
+            if self._browser is None:
+                return
+            logger.info("Stopping Playwright browser manager")
+            if self._memory_monitor is not None:
+                self._memory_monitor.cancel()
+                self._memory_monitor = None
+            idle, self._idle = self._idle, []
+            for pooled in idle:
+                await self._close_page(pooled)
+            for browser in [self._browser, *self._retired]:
+                try:
+                    await browser.close()
+                except Exception as e:
+                    logger.debug(f"Error closing browser: {str(e)}")
+            self._browser = None
+            self._retired.clear()
+            self._in_use.clear()
+            await self._playwright.stop()
+            self._playwright = None
+
+
+browser_manager = BrowserManager(BrowserSettings())
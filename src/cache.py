@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Hashable
+
+from logger import get_logger
+
+# Set up logging
+logger = get_logger()
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable sha256 over a mix of bytes, strings and JSON-serialisable values."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode()
+        else:
+            data = json.dumps(part, sort_keys=True, default=str).encode()
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class TTLCache:
+    """In-memory LRU cache with a per-entry TTL and a hard cap on entry count."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """File-per-entry text cache that survives restarts.
+
+    Each entry's expiry is stored as the file's mtime, so expired entries are
+    recognised without reading them and the soonest-to-expire files are the first
+    evicted. Entries written are counted approximately, and the directory is only
+    scanned once that count passes `max_size` by EVICT_HEADROOM, at which point it
+    is trimmed back to `max_size`.
+    """
+
+    EVICT_HEADROOM = 0.1
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._high_water = max_size + max(int(max_size * self.EVICT_HEADROOM), 1)
+        # Other processes sharing the directory aren't counted; the scan at the
+        # high-water mark corrects for them
+        self._count = sum(1 for p in self.directory.iterdir() if p.suffix != ".tmp")
+
+    def _path(self, key: str) -> Path:
+        return self.directory / hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        """Return (value, seconds left to live), or None if missing or expired."""
+        path = self._path(key)
+        try:
+            ttl = path.stat().st_mtime - time.time()
+            if ttl <= 0:
+                path.unlink(missing_ok=True)
+                self._count -= 1
+                return None
+            return path.read_text(encoding="utf-8"), ttl
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(value, encoding="utf-8")
+        expires_at = time.time() + ttl
+        os.utime(tmp_path, (expires_at, expires_at))
+        if not path.exists():
+            self._count += 1
+        tmp_path.replace(path)
+        if self._count > self._high_water:
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue  # Removed by another process
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_size, 0)]:
+            path.unlink(missing_ok=True)
+        self._count = min(len(entries), self.max_size)
+
+
+class TieredCache:
+    """Text cache with an in-memory LRU tier in front of an optional disk tier.
+
+    Disk access runs in a worker thread so lookups never block the event loop.
+    """
+
+    def __init__(
+        self, max_size: int, directory: str | None = None, disk_max_size: int = 0
+    ) -> None:
+        self.memory = TTLCache(max_size)
+        self.disk = DiskCache(directory, disk_max_size) if directory else None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key)
+            if entry is not None:
+                value, ttl = entry
+                self.memory.set(key, value, ttl)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value, ttl)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry to disk: {str(e)}")
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs
+    await the same task and receive the same result or exception. The task is
+    shielded, so one caller giving up does not cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joining in-flight request for {key}")
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._in_flight
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import os
+import time
+
+from logger import get_logger
+from service_types import CoinGeckoSearch, Error, RequestPriority, error
+from settings import CoinIndexSettings
+from utils import CoinGeckoRateLimiter, send_request
+
+# Set up logging
+logger = get_logger()
+
+COINGECKO_COINS_LIST_URL = (
+    "https://api.coingecko.com/api/v3/coins/list?include_platform=true"
+)
+
+
+def build_index(coins: list[dict]) -> dict[str, dict[str, list[list[str]]]]:
+    """Group CoinGecko's coins list as chain -> symbol -> [[id, name, contract]]."""
+    index: dict[str, dict[str, list[list[str]]]] = {}
+    for coin in coins:
+        symbol = (coin.get("symbol") or "").lower()
+        for chain, contract_address in (coin.get("platforms") or {}).items():
+            if not chain or not contract_address:
+                continue
+            index.setdefault(chain, {}).setdefault(symbol, []).append(
+                [coin["id"], coin.get("name", ""), contract_address]
+            )
+    return index
+
+
+class CoinIndex:
+    """Local (symbol, chain) -> candidate contracts index.
+
+    Built in bulk from CoinGecko's coins list with platforms, so resolving a symbol
+    is a dict lookup rather than a /search plus one /coins/{id} call per candidate.
+    The index is snapshotted to a gzipped JSON file and refreshed on a schedule.
+    """
+
+    def __init__(self, settings: CoinIndexSettings) -> None:
+        self.settings = settings
+        self._index: dict[str, dict[str, list[list[str]]]] = {}
+        self.updated_at = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._index)
+
+    def lookup(self, symbol: str, chain: str) -> list[CoinGeckoSearch]:
+        candidates = self._index.get(chain, {}).get(symbol.lower(), [])
+        return [
+            CoinGeckoSearch(
+                coin_gecko_id=coin_id,
+                symbol=symbol.lower(),
+                name=name,
+                chain=chain,
+                contract_address=contract_address,
+            )
+            for coin_id, name, contract_address in candidates
+        ]
+
+    def _load_snapshot(self) -> bool:
+        path = self.settings.coin_index_path
+        if not path or not os.path.exists(path):
+            return False
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self._index = snapshot["index"]
+        self.updated_at = snapshot["updated_at"]
+        logger.info(f"Loaded coin index snapshot from {path}")
+        return True
+
+    def _save_snapshot(self) -> None:
+        path = self.settings.coin_index_path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Per process, so workers saving at the same moment don't share a file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {"updated_at": self.updated_at, "index": self._index},
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, path)
+        logger.debug(f"Saved coin index snapshot to {path}")
+
+    async def refresh(self, coin_gecko_api_key: str) -> error:
+        logger.info("Refreshing CoinGecko coin index")
+        await CoinGeckoRateLimiter().acquire(RequestPriority.BACKGROUND)
+        response = await send_request(
+            COINGECKO_COINS_LIST_URL,
+            headers={"x-cg-demo-api-key": coin_gecko_api_key},
+        )
+        if response.status_code != 200:
+            return Error(f"Coin index refresh failed: HTTP {response.status_code}")
+
+        index = await asyncio.to_thread(build_index, response.json())
+        self._index = index
+        self.updated_at = time.time()
+        try:
+            await asyncio.to_thread(self._save_snapshot)
+        except OSError as e:
+            logger.warning(f"Could not save coin index snapshot: {str(e)}")
+        logger.info(f"Coin index refreshed: {sum(map(len, index.values()))} symbols")
+        return None
+
+    async def run(self, coin_gecko_api_key: str) -> None:
+        """Load the snapshot, then keep the index fresh until cancelled."""
+        try:
+            await asyncio.to_thread(self._load_snapshot)
+        except Exception as e:
+            # A truncated gzip raises EOFError; any bad snapshot is just refetched
+            logger.warning(f"Could not load coin index snapshot: {str(e)}")
+
+        interval = self.settings.coin_index_refresh_interval
+        while True:
+            age = time.time() - self.updated_at
+            if age >= interval:
+                try:
+                    err = await self.refresh(coin_gecko_api_key)
+                except Exception as e:
+                    err = Error(str(e))
+                if err:
+                    logger.error(err.message)
+                    age = interval - self.settings.coin_index_retry_interval
+                else:
+                    age = 0
+            await asyncio.sleep(interval - age)
+
+
+coin_index = CoinIndex(CoinIndexSettings())
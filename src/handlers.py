@@ -1,43 +1,129 @@
+import asyncio
 import re
+import time
+from typing import Any
 from warnings import resetwarnings
 
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from aiogram.types import (CallbackQuery, InlineKeyboardButton,
                            InlineKeyboardMarkup, InputFile, Message)
 from httpx import delete
 
-from ibm_storage import IBMStorage
+from cache import TieredCache
+from ibm_storage import AsyncIBMStorage, IBMStorage
+from jobs import RenderQueue
 from logger import get_logger
-from service_types import Chain, Error, TokenSelection, error
-from services import run, search_token, top_traders_page_url
-from settings import CoinGeckoAPISettings, IBMSettings
+from middlewares import released_update_slot
+from prerender import Prerenderer
+from service_types import Chain, CoinGeckoSearch, Error, TokenSelection, error
+from services import search_token_stream
+from sessions import session_store
+from settings import (CacheSettings, CoinGeckoAPISettings, IBMSettings,
+                      PrerenderSettings, RenderQueueSettings)
 from utils import (generate_token_description_text, get_chain_full_name,
                    to_chain)
 
-temp_token_data = {}
 ibm_settings = IBMSettings()
 coin_gecko_settings = CoinGeckoAPISettings()
-ibm_storage = IBMStorage(ibm_settings)
+ibm_storage = AsyncIBMStorage(IBMStorage(ibm_settings))
 token_router = Router(name=__name__)
+render_queue = RenderQueue(RenderQueueSettings(), ibm_storage)
+prerenderer = Prerenderer(PrerenderSettings(), render_queue)
+cache_settings = CacheSettings()
+telegram_file_ids = TieredCache(
+    cache_settings.telegram_file_id_cache_size,
+    directory=cache_settings.telegram_file_id_cache_dir,
+    disk_max_size=cache_settings.telegram_file_id_cache_disk_size,
+)
 logger = get_logger()
 
+# Minimum seconds between edits of the token selection keyboard, to stay clear of
+# Telegram's flood control
+SELECTION_UPDATE_INTERVAL = 1.0
+
+
+async def queue_render(
+    message: Message,
+    kind: str,
+    contract_address: str,
+    chain: str,
+    status_message: Message | None = None,
+) -> tuple[Any, error]:
+    """Queue a render job and wait for its result, telling the user where they are
+    in the queue. If the queue is full the user is asked to retry and an Error is
+    returned straight away."""
+    submitted, err = render_queue.submit(
+        kind, contract_address=contract_address, chain=chain
+    )
+    if err:
+        logger.warning(err.message)
+        await message.reply("⏳ The bot is busy right now, please try again in a minute")
+        return None, err
+    future, position = submitted
+    if position and status_message is not None:
+        await status_message.edit_text(
+            f"⏳ You're #{position} in the queue for {contract_address} on {chain.upper()}"
+        )
+    # Renders are bounded by the queue, so waiting doesn't hold an update slot
+    async with released_update_slot():
+        result = await asyncio.shield(future)
+    return result, None
+
+
+async def reply_photo_cached(
+    message: Message, url: str, key: str | None, caption: str
+) -> Message:
+    """Reply with a rendered image, reusing the file_id Telegram gave it the last
+    time it was sent. Falls back to the URL when there is no usable file_id."""
+    # file_ids are only valid for the bot that received them
+    cache_key = f"{message.bot.id}:{key}" if key else None
+    if cache_key and (file_id := await telegram_file_ids.get(cache_key)):
+        try:
+            return await message.reply_photo(photo=file_id, caption=caption)
+        except TelegramBadRequest as e:
+            logger.warning(f"Cached file_id rejected, sending by URL: {e.message}")
+
+    sent = await message.reply_photo(photo=url, caption=caption)
+    if cache_key and sent.photo:
+        await telegram_file_ids.set(
+            cache_key,
+            sent.photo[-1].file_id,
+            cache_settings.telegram_file_id_cache_ttl,
+        )
+    return sent
+
 
 async def process_and_reply(
-    message: Message, contract_address: str, chain: str
+    message: Message,
+    contract_address: str,
+    chain: str,
+    status_message: Message | None = None,
 ) -> error:
     """Helper function to process and send reply"""
     try:
-        response = await run(
-            contract_address=contract_address, chain=chain, ibm_storage=ibm_storage
-        )
+        await prerenderer.record(contract_address, chain)
+        response = await prerenderer.get_card(contract_address, chain)
+        if response is None:
+            response, err = await queue_render(
+                message, "token_card", contract_address, chain, status_message
+            )
+            if err:
+                # The user has already been told to retry
+                return
+        if response is None:
+            return Error(f"No token data for {contract_address}/{chain}")
         response_text = generate_token_description_text(
             response.token_data, response.token_metrics
         )
 
-        send_photo_message = await message.reply_photo(
-            photo=response.screenshot_url, caption=f"{contract_address}/{chain}"
+        send_photo_message = await reply_photo_cached(
+            message,
+            response.screenshot_url,
+            response.screenshot_key,
+            f"{contract_address}/{chain}",
         )
         await send_photo_message.reply(
             text=response_text,
@@ -84,9 +170,20 @@ async def bm_command_handler(message: Message):
     response_message = await message.reply(
         f"Getting info for {contract_address} on {chain.upper()}"
     )
-    visualization_url = await top_traders_page_url(
-        ibm_storage=ibm_storage, chain=chain, contract_address=contract_address
-    )
+    try:
+        visualization_url, err = await queue_render(
+            message, "top_traders", contract_address, chain, response_message
+        )
+    except Exception as e:
+        logger.error(f"Top traders render failed: {str(e)}")
+        visualization_url, err = None, None
+    await response_message.delete()
+    if err:
+        # The user has already been told to retry
+        return
+    if visualization_url is None:
+        await message.reply(f"oops!! something went wrong {contract_address}/{chain}")
+        return
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
@@ -96,14 +193,13 @@ async def bm_command_handler(message: Message):
             ]
         ]
     )
-    await response_message.delete()
     await message.reply(
         "Here's your token network visualization:", reply_markup=keyboard
     )
 
 
 @token_router.message(Command("bi"))
-async def bi_command_handler(message: Message):
+async def bi_command_handler(message: Message, state: FSMContext):
     contract_address_chain_pattern = (
         r"^(0x[a-fA-F0-9]{40}|[1-9A-HJ-NP-Za-km-z]{32,44})/([a-zA-Z]+)$"
     )
@@ -130,7 +226,7 @@ async def bi_command_handler(message: Message):
             )
             return
 
-        err = await handle_token_name(message, token, chain)
+        err = await handle_token_name(message, token, chain, state)
     elif match := re.match(contract_address_chain_pattern, token.strip()):
         token, chain = match.groups()
         chain, err = to_chain(chain)
@@ -163,66 +259,130 @@ async def handle_contract_address(message: Message, contract_address, chain) ->
     response_message = await message.reply(
         f"Getting info for {contract_address} on {chain.upper()}"
     )
-    err = await process_and_reply(message, contract_address, chain)
+    err = await process_and_reply(message, contract_address, chain, response_message)
     await response_message.delete()
     return err
 
 
-async def handle_token_name(message: Message, token, chain):
+def selection_key(user_id: int) -> str:
+    return f"token_selection:{user_id}"
+
+
+def build_selection_keyboard(token_options: list) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text=f"{tkn.name} ({tkn.contract_address[:6]}...{tkn.contract_address[-4:]})",
+                    callback_data=f"select_token:{idx}",
+                )
+            ]
+            for idx, tkn in enumerate(token_options)
+        ]
+    )
+
+
+async def handle_token_name(message: Message, token, chain, state: FSMContext):
     response_message = await message.reply(
         f"Getting info for {token} on {chain.upper()}"
     )
     chain_full_name, _ = get_chain_full_name(chain)
-    # Fetch token options from API
-    token_options, err = await search_token(
-        coin_gecko_settings.coin_gecko_api_key, symbol=token, chain=chain_full_name
-    )
-    if len(token_options) == 0 or err:
+    # Matches are shown as they resolve: the selection keyboard appears with the
+    # second match and is updated at most every SELECTION_UPDATE_INTERVAL seconds
+    # as further candidates come in, then once more when the search ends
+    token_options = []
+    selection_message = None
+    shown = 0
+    last_update = 0.0
+
+    async def show_options() -> None:
+        nonlocal selection_message, shown, last_update
+        # Store options in the session store until the user picks one
+        await session_store.set(
+            selection_key(message.from_user.id),
+            {
+                "options": [tkn.model_dump() for tkn in token_options],
+                "chain": chain,
+                "original_message_id": message.message_id,
+            },
+        )
+        keyboard = build_selection_keyboard(token_options)
+        if selection_message is None:
+            selection_message = await message.reply(
+                f"🔍 Multiple tokens found for ${token} on {chain.upper()} chain:",
+                reply_markup=keyboard,
+            )
+            await state.set_state(TokenSelection.waiting_for_selection)
+        else:
+            try:
+                await selection_message.edit_reply_markup(reply_markup=keyboard)
+            except TelegramAPIError as e:
+                # The stored options are complete; the next update shows them
+                logger.warning(f"Could not update token options: {str(e)}")
+                last_update = time.monotonic()
+                return
+        shown = len(token_options)
+        last_update = time.monotonic()
+
+    try:
+        async for tkn in search_token_stream(
+            coin_gecko_settings.coin_gecko_api_key,
+            symbol=token,
+            chain=chain_full_name,
+        ):
+            token_options.append(tkn)
+            if (
+                len(token_options) >= 2
+                and time.monotonic() - last_update >= SELECTION_UPDATE_INTERVAL
+            ):
+                await show_options()
+    except Error as err:
+        if not token_options:
+            await response_message.delete()
+            return err
         logger.error("Handler error %s", err.message)
+    except TelegramAPIError as e:
+        logger.error(f"Could not show token options: {str(e)}")
+        await response_message.delete()
+        return Error(str(e))
+
+    if len(token_options) >= 2 and shown < len(token_options):
+        try:
+            await show_options()
+        except TelegramAPIError as e:
+            logger.error(f"Could not show token options: {str(e)}")
+            await response_message.delete()
+            return Error(str(e))
+
+    if len(token_options) == 0:
         await response_message.edit_text(
             f"❌ No tokens found for ${token} on {chain.upper()} chain"
         )
         return
 
     if len(token_options) == 1:
-        await process_and_reply(message, token_options[0].contract_address, chain)
-        await response_message.delete()
-        return
-    # Multiple options - present selection
-    keyboard = InlineKeyboardMarkup()
-    for idx, tkn in enumerate(token_options):
-        keyboard.add(
-            InlineKeyboardButton(
-                text=f"{tkn.name} ({tkn.contract_address[:6]}...{tkn.contract_address[-4:]})",
-                callback_data=f"select_token:{idx}",
-            )
+        err = await process_and_reply(
+            message, token_options[0].contract_address, chain, response_message
         )
+        await response_message.delete()
+        return err
 
-    # Store options in temporary storage
-    temp_token_data[message.from_user.id] = {
-        "options": token_options,
-        "chain": chain,
-        "original_message_id": message.message_id,
-    }
-
-    await message.reply(
-        f"🔍 Multiple tokens found for ${token} on {chain.upper()} chain:",
-        reply_markup=keyboard,
-    )
-    await TokenSelection.waiting_for_selection.set()
+    await response_message.delete()
 
 
+@token_router.callback_query(F.data.startswith("select_token:"))
 async def handle_token_selection(callback_query: CallbackQuery, state: FSMContext):
     """Handle user's token selection from inline keyboard"""
-    user_id = callback_query.from_user.id
-    if user_id not in temp_token_data:
+    token_data = await session_store.pop(selection_key(callback_query.from_user.id))
+    if token_data is None:
         await callback_query.answer("Session expired. Please try again.")
+        await state.clear()
         return
 
     # Get selected token
     selected_idx = int(callback_query.data.split(":")[1])
-    token_data = temp_token_data[user_id]
-    selected_token = token_data["options"][selected_idx]
+    selected_token = CoinGeckoSearch(**token_data["options"][selected_idx])
+    await callback_query.answer()
 
     # Delete the original message with token options
     try:
@@ -237,14 +397,15 @@ async def handle_token_selection(callback_query: CallbackQuery, state: FSMContex
     except:
         pass  # Don't fail if message can't be deleted
 
+    # Clean up
+    await state.clear()
+
     # Process the selected token
-    await process_and_reply(
-        callback_query.message, selected_token["address"], token_data["chain"]
+    err = await process_and_reply(
+        callback_query.message, selected_token.contract_address, token_data["chain"]
     )
-
-    # Clean up
-    del temp_token_data[user_id]
-    await state.finish()
+    if err:
+        logger.error(err.message)
 
 
 # TODO add a disclaimer for the $token/chain handler
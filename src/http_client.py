@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from urllib.parse import urlsplit
+
+import httpx
+
+from logger import get_logger
+from settings import HTTPSettings
+
+# Set up logging
+logger = get_logger()
+
+
+class HTTPClientRegistry:
+    """Application-scoped registry holding one pooled, keep-alive `httpx.AsyncClient`
+    per upstream host, so repeated calls reuse connections instead of paying a new
+    TCP and TLS handshake every time."""
+
+    def __init__(self, settings: HTTPSettings) -> None:
+        self.settings = settings
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def _create_client(self, host: str) -> httpx.AsyncClient:
+        logger.info(f"[HTTP] Creating pooled client for {host}")
+        transport = httpx.AsyncHTTPTransport(
+            http2=self.settings.http2,
+            retries=self.settings.http_retries,
+            limits=httpx.Limits(
+                max_connections=self.settings.http_max_connections,
+                max_keepalive_connections=self.settings.http_max_keepalive_connections,
+                keepalive_expiry=self.settings.http_keepalive_expiry,
+            ),
+        )
+        return httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(
+                self.settings.http_read_timeout,
+                connect=self.settings.http_connect_timeout,
+            ),
+        )
+
+    def start(self) -> None:
+        """Create clients for the known upstream hosts ahead of the first request."""
+        for host in self.settings.http_upstream_hosts:
+            self.get(f"https://{host}")
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        host = urlsplit(url).netloc
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = self._clients[host] = self._create_client(host)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for host, client in clients.items():
+            await client.aclose()
+            logger.info(f"[HTTP] Closed pooled client for {host}")
+
+
+http_clients = HTTPClientRegistry(HTTPSettings())
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import TYPE_CHECKING, BinaryIO, Optional, Tuple, Union
 
 import ibm_boto3
+from ibm_boto3.s3.transfer import TransferConfig
 from ibm_botocore.client import ClientError, Config
 
 # Set up logger
@@ -36,6 +39,11 @@ class IBMStorage:
         logger.debug("Initializing IBMStorage class...")
         self.credentials = settings
         self._client = _create_client(self.credentials)
+        self._transfer_config = TransferConfig(
+            multipart_threshold=settings.ibm_multipart_threshold,
+            multipart_chunksize=settings.ibm_multipart_chunksize,
+            max_concurrency=settings.ibm_max_concurrency,
+        )
 
     def get_buckets(self):
         logger.info("Retrieving list of buckets")
@@ -53,6 +61,7 @@ class IBMStorage:
         file_data: Union[str, bytes, BinaryIO],
         object_name: str,
         folder_path: Optional[str] = None,
+        extra_args: Optional[dict[str, str]] = None,
     ) -> Tuple[Optional[str], error]:
         bucket_name = self.credentials.ibm_bucket_name
 
@@ -69,7 +78,13 @@ class IBMStorage:
         try:
             if isinstance(file_data, str):
                 logger.debug("Uploading file from path: %s", file_data)
-                self._client.upload_file(file_data, bucket_name, full_object_name)
+                self._client.upload_file(
+                    file_data,
+                    bucket_name,
+                    full_object_name,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config,
+                )
             else:
                 logger.debug("Uploading file from bytes/BinaryIO")
                 file_obj = BytesIO(file_data)
@@ -77,6 +92,8 @@ class IBMStorage:
                     file_obj,
                     bucket_name,
                     full_object_name,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config,
                 )
 
             logger.info("Upload successful: %s", full_object_name)
@@ -103,10 +120,27 @@ class IBMStorage:
         return self.upload_to_bucket(file_path, object_name, folder_path)
 
     def upload_bytes(
-        self, data: bytes, object_name: str, folder_path: Optional[str] = None
+        self,
+        data: bytes,
+        object_name: str,
+        folder_path: Optional[str] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+        cache_control: Optional[str] = None,
     ) -> Tuple[Optional[str], Error]:
         logger.debug("Preparing to upload bytes as: %s", object_name)
-        return self.upload_to_bucket(data, object_name, folder_path)
+        extra_args = {
+            key: value
+            for key, value in (
+                ("ContentType", content_type),
+                ("ContentEncoding", content_encoding),
+                ("CacheControl", cache_control),
+            )
+            if value
+        }
+        return self.upload_to_bucket(
+            data, object_name, folder_path, extra_args=extra_args or None
+        )
 
     def download_objects(
         self,
@@ -145,3 +179,61 @@ class IBMStorage:
         except Exception as e:
             logger.error("Presigned URL generation failed: %s", e)
             return None, Error("Failed to generate presigned URL: {str(e)}")
+
+
+class AsyncIBMStorage:
+    """Async facade over IBMStorage.
+
+    boto3 calls are blocking, so they run on a bounded thread pool instead of the
+    event loop. Concurrent callers share the pool, so several uploads can be in
+    flight at once.
+    """
+
+    def __init__(self, storage: IBMStorage) -> None:
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(
+            max_workers=storage.credentials.ibm_upload_workers,
+            thread_name_prefix="ibm-cos",
+        )
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def upload_bytes(
+        self,
+        data: bytes,
+        object_name: str,
+        folder_path: Optional[str] = None,
+        content_type: Optional[str] = None,
+        content_encoding: Optional[str] = None,
+        cache_control: Optional[str] = None,
+    ) -> Tuple[Optional[str], error]:
+        return await self._run(
+            self.storage.upload_bytes,
+            data,
+            object_name,
+            folder_path,
+            content_type,
+            content_encoding,
+            cache_control,
+        )
+
+    async def upload_file(
+        self,
+        file_path: str,
+        object_name: Optional[str] = None,
+        folder_path: Optional[str] = None,
+    ) -> Tuple[Optional[str], error]:
+        return await self._run(
+            self.storage.upload_file, file_path, object_name, folder_path
+        )
+
+    async def download_objects(
+        self, object_name: str, destination: Union[str, BinaryIO] = None
+    ) -> Tuple[Optional[str], error]:
+        return await self._run(self.storage.download_objects, object_name, destination)
+
+    def close(self) -> None:
+        logger.debug("Shutting down IBM COS upload pool")
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+from PIL import Image
+
+from logger import get_logger
+from settings import ImageSettings
+
+# Set up logging
+logger = get_logger()
+
+CONTENT_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+
+def optimize_image(
+    image_bytes: bytes,
+    max_size: int,
+    image_format: str,
+    quality: int,
+    progressive: bool,
+) -> bytes:
+    """Resize and re-encode a captured screenshot, or return it untouched when it is
+    already a baseline JPEG within `max_size`. Runs in a worker process."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if (
+        img.format == "JPEG"
+        and image_format == "jpeg"
+        and not progressive
+        and max(img.size) <= max_size
+    ):
+        return image_bytes
+
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    if image_format == "webp":
+        img.save(output, format="WEBP", quality=quality, method=4)
+    else:
+        img.save(
+            output,
+            format="JPEG",
+            quality=quality,
+            optimize=True,
+            progressive=progressive,
+        )
+    return output.getvalue()
+
+
+class ImagePipeline:
+    """Screenshot post-processing kept off the event loop.
+
+    Pillow work runs in a small process pool, so decoding and encoding neither
+    blocks the loop nor contends for the GIL with the bot.
+    """
+
+    def __init__(self, settings: ImageSettings) -> None:
+        self.settings = settings
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.settings.image_format]
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.settings.image_format]
+
+    @property
+    def screenshot_options(self) -> dict:
+        """Playwright screenshot options that capture as close to the final image
+        as the browser allows."""
+        return {"type": "jpeg", "quality": self.settings.image_quality, "scale": "css"}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.settings.image_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def run(self, func: Callable[..., bytes], *args) -> bytes:
+        """Run a CPU-bound, picklable image function in the pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_pool(), func, *args
+        )
+
+    async def process(self, image_bytes: bytes, name: str = "image") -> bytes:
+        started = time.perf_counter()
+        output = await self.run(
+            optimize_image,
+            image_bytes,
+            self.settings.image_max_size,
+            self.settings.image_format,
+            self.settings.image_quality,
+            self.settings.image_progressive,
+        )
+        logger.info(
+            "Processed %s in %.0fms: %s -> %s bytes (%s)",
+            name,
+            (time.perf_counter() - started) * 1000,
+            len(image_bytes),
+            len(output),
+            self.settings.image_format,
+        )
+        return output
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+image_pipeline = ImagePipeline(ImageSettings())
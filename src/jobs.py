@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from ibm_storage import AsyncIBMStorage, IBMStorage
+from logger import get_logger
+from service_types import Error, RequestPriority, error
+from services import run, top_traders_page_url
+from settings import IBMSettings, RenderQueueSettings
+
+# Set up logging
+logger = get_logger()
+
+# Job kinds and the pipeline each one runs; every handler takes ibm_storage,
+# contract_address and chain, plus any options the job was submitted with
+JOB_HANDLERS = {
+    "token_card": run,
+    "top_traders": top_traders_page_url,
+}
+
+# State owned by a render worker process in "process" mode
+_worker_loop: asyncio.AbstractEventLoop | None = None
+_worker_storage: AsyncIBMStorage | None = None
+
+
+def _init_worker_process() -> None:
+    global _worker_loop, _worker_storage
+    from utils import template_registry
+
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    _worker_storage = AsyncIBMStorage(IBMStorage(IBMSettings()))
+    template_registry.load_all()
+    logger.info(f"Render worker process {multiprocessing.current_process().name} ready")
+
+
+def _run_job_in_process(kind: str, kwargs: dict[str, Any]) -> Any:
+    # The loop persists between jobs, so the process keeps its browser warm
+    return _worker_loop.run_until_complete(
+        JOB_HANDLERS[kind](ibm_storage=_worker_storage, **kwargs)
+    )
+
+
+class RenderJob:
+    def __init__(self, key: tuple, kind: str, kwargs: dict[str, Any]) -> None:
+        self.key = key
+        self.kind = kind
+        self.kwargs = kwargs
+        self.started = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def priority(self) -> RequestPriority:
+        return self.kwargs.get("priority", RequestPriority.INTERACTIVE)
+
+
+class RenderQueue:
+    """Bounded queue of render jobs consumed by a fixed pool of workers.
+
+    Handlers submit jobs and await their futures, so the update path never runs
+    Chromium directly. Submissions are rejected once `render_queue_size` jobs are
+    waiting, and a job identical to one already queued or running shares its
+    future instead of being queued again. A higher priority submission never waits
+    on a lower priority job: it raises the job's priority if the job hasn't started,
+    and is queued as a job of its own otherwise.
+    """
+
+    def __init__(self, settings: RenderQueueSettings, ibm_storage: AsyncIBMStorage):
+        self.settings = settings
+        self.ibm_storage = ibm_storage
+        self._queue: asyncio.Queue[RenderJob] | None = None
+        self._jobs: dict[tuple, RenderJob] = {}
+        self._workers: list[asyncio.Task] = []
+        self._pool: ProcessPoolExecutor | None = None
+        self._busy = 0
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.settings.render_queue_size)
+        if self.settings.render_worker_mode == "process":
+            # Spawned rather than forked, so workers don't inherit this process's
+            # browser connection and event loop
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.settings.render_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker_process,
+            )
+        self._workers = [
+            asyncio.create_task(self._worker(n))
+            for n in range(self.settings.render_workers)
+        ]
+        logger.info(
+            "Started %s %s render workers",
+            self.settings.render_workers,
+            self.settings.render_worker_mode,
+        )
+
+    def submit(
+        self, kind: str, *, contract_address: str, chain: str, **options: Any
+    ) -> tuple[tuple[asyncio.Future, int] | None, error]:
+        """Queue a job and return (future, position), where position is how many
+        jobs will run ahead of it, or an Error if the queue is full."""
+        key = (kind, chain, contract_address)
+        priority = options.get("priority", RequestPriority.INTERACTIVE)
+        if job := self._jobs.get(key):
+            if priority >= job.priority:
+                logger.info(f"Joining queued render job {key}")
+                return (job.future, 0), None
+            if not job.started:
+                logger.info(f"Raising queued render job {key} to {priority.name}")
+                job.kwargs["priority"] = priority
+                return (job.future, 0), None
+
+        job = RenderJob(
+            key, kind, {"contract_address": contract_address, "chain": chain, **options}
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            return None, Error("Render queue is full")
+        self._jobs[key] = job
+        position = max(
+            self._queue.qsize() + self._busy - self.settings.render_workers, 0
+        )
+        logger.debug(f"Queued render job {key} at position {position}")
+        return (job.future, position), None
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.started = True
+            self._busy += 1
+            try:
+                result = await self._execute(job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Render worker {n} failed job {job.key}: {str(e)}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._busy -= 1
+                # A higher priority job may have taken over the key
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                self._queue.task_done()
+
+    async def _execute(self, job: RenderJob) -> Any:
+        if self._pool is not None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, _run_job_in_process, job.kind, job.kwargs
+            )
+        return await JOB_HANDLERS[job.kind](ibm_storage=self.ibm_storage, **job.kwargs)
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def stop(self) -> None:
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for job in self._jobs.values():
+            job.future.cancel()
+        self._jobs.clear()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        logger.info("Render workers stopped")
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import numpy as np
+
+from logger import get_logger
+
+# Set up logging
+logger = get_logger()
+
+# These mirror the d3 forces the bubble map templates used to run in the browser
+LAYOUT_WIDTH = 1080
+LAYOUT_HEIGHT = 900
+LINK_DISTANCE = 200
+CHARGE_STRENGTH = -100
+COLLIDE_PADDING = 10
+RADIUS_RANGE = (10, 90)
+ITERATIONS = 300
+VELOCITY_DECAY = 0.6
+ALPHA_MIN = 0.001
+
+
+def radius_scale(amounts: np.ndarray, radius_range=RADIUS_RANGE) -> np.ndarray:
+    """Square-root scale from [0, max(amount)] to `radius_range`, like d3.scaleSqrt."""
+    low, high = radius_range
+    max_amount = amounts.max() if amounts.size else 0
+    if max_amount <= 0:
+        return np.full(amounts.shape, float(low))
+    return low + (high - low) * np.sqrt(np.clip(amounts, 0, None) / max_amount)
+
+
+def _pairwise_dist_sq(pos: np.ndarray) -> np.ndarray:
+    norms = (pos**2).sum(axis=1)
+    return np.maximum(norms[:, None] + norms[None, :] - 2 * pos @ pos.T, 0.0)
+
+
+def _valid_links(links: list[dict], node_count: int) -> np.ndarray:
+    edges = np.array(
+        [(link["source"], link["target"]) for link in links], dtype=np.int64
+    ).reshape(-1, 2)
+    in_range = (edges >= 0).all(axis=1) & (edges < node_count).all(axis=1)
+    edges = edges[in_range & (edges[:, 0] != edges[:, 1])]
+    return edges
+
+
+def compute_layout(
+    amounts: np.ndarray, edges: np.ndarray, iterations: int = ITERATIONS
+) -> np.ndarray:
+    """Run a vectorized force layout and return an (n, 2) array of positions.
+
+    The simulation follows d3-force: link springs, many-body repulsion, a centering
+    force and collision between radius-scaled bubbles, integrated with velocity
+    Verlet under a decaying alpha. Initial positions use d3's phyllotaxis spiral so
+    the result is deterministic for a given graph.
+    """
+    n = amounts.shape[0]
+    if n == 0:
+        return np.zeros((0, 2))
+
+    index = np.arange(n)
+    spiral_radius = 10 * np.sqrt(0.5 + index)
+    spiral_angle = index * np.pi * (3 - np.sqrt(5))
+    pos = np.column_stack(
+        (spiral_radius * np.cos(spiral_angle), spiral_radius * np.sin(spiral_angle))
+    )
+    pos += (LAYOUT_WIDTH / 2, LAYOUT_HEIGHT / 2)
+    vel = np.zeros_like(pos)
+
+    radii = radius_scale(amounts) + COLLIDE_PADDING
+    radii_sq = radii**2
+    min_distance = radii[:, None] + radii[None, :]
+    collide_weight = radii_sq[None, :] / (radii_sq[:, None] + radii_sq[None, :])
+    not_self = ~np.eye(n, dtype=bool)
+
+    source, target = edges[:, 0], edges[:, 1]
+    degree = np.bincount(edges.ravel(), minlength=n).astype(float)
+    link_strength = 1 / np.maximum(np.minimum(degree[source], degree[target]), 1)
+    link_bias = degree[source] / np.maximum(degree[source] + degree[target], 1)
+
+    alpha = 1.0
+    alpha_decay = 1 - ALPHA_MIN ** (1 / iterations)
+
+    for _ in range(iterations):
+        alpha += -alpha * alpha_decay
+
+        # Link springs pull connected nodes towards LINK_DISTANCE
+        if edges.size:
+            delta = (pos[target] + vel[target]) - (pos[source] + vel[source])
+            length = np.maximum(np.linalg.norm(delta, axis=1), 1e-6)
+            pull = ((length - LINK_DISTANCE) / length * alpha * link_strength)[:, None]
+            np.add.at(vel, target, -delta * pull * link_bias[:, None])
+            np.add.at(vel, source, delta * pull * (1 - link_bias)[:, None])
+
+        # Many-body repulsion between every pair of nodes
+        dist_sq = np.maximum(_pairwise_dist_sq(pos), 1.0)
+        weight = np.where(not_self, CHARGE_STRENGTH * alpha / dist_sq, 0.0)
+        vel += weight @ pos - pos * weight.sum(axis=1)[:, None]
+
+        # Collision pushes overlapping bubbles apart, weighted by their size
+        predicted = pos + vel
+        dist = np.sqrt(np.maximum(_pairwise_dist_sq(predicted), 1e-12))
+        overlap = np.where(
+            not_self & (dist < min_distance), (min_distance - dist) / dist, 0.0
+        )
+        push = overlap * collide_weight
+        vel += predicted * push.sum(axis=1)[:, None] - push @ predicted
+
+        vel *= VELOCITY_DECAY
+        pos += vel
+
+        # Keep the graph centred on the canvas
+        pos += (LAYOUT_WIDTH / 2, LAYOUT_HEIGHT / 2) - pos.mean(axis=0)
+
+    return pos
+
+
+def apply_layout(chart_data: dict | None) -> dict | None:
+    """Embed precomputed `x`/`y` positions into each node of a Bubblemaps map-data
+    payload so templates can draw it without running a simulation."""
+    if not chart_data or not chart_data.get("nodes"):
+        return chart_data
+
+    nodes = chart_data["nodes"]
+    amounts = np.array([node.get("amount") or 0 for node in nodes], dtype=float)
+    edges = _valid_links(chart_data.get("links", []), len(nodes))
+    logger.debug(f"Computing layout for {len(nodes)} nodes and {len(edges)} links")
+
+    positions = np.round(compute_layout(amounts, edges), 2)
+    for node, (x, y) in zip(nodes, positions.tolist()):
+        node["x"] = x
+        node["y"] = y
+    return chart_data
+
+
+def top_traders(chart_data: dict | None, count: int) -> dict | None:
+    """Prune a map-data payload to its `count` largest holders and the links among
+    them, with link endpoints renumbered to index the pruned node list."""
+    if not chart_data or not chart_data.get("nodes"):
+        return chart_data
+
+    nodes = chart_data["nodes"]
+    amounts = np.array([node.get("amount") or 0 for node in nodes], dtype=float)
+    count = min(count, len(nodes))
+    top = np.argpartition(-amounts, count - 1)[:count]
+    top = top[np.argsort(-amounts[top], kind="stable")]
+
+    remap = np.full(len(nodes), -1, dtype=np.int64)
+    remap[top] = np.arange(count)
+    links = chart_data.get("links") or []
+    link_ends = np.array(
+        [(link["source"], link["target"]) for link in links], dtype=np.int64
+    ).reshape(-1, 2)
+    in_range = ((link_ends >= 0) & (link_ends < len(nodes))).all(axis=1)
+    renumbered = remap[np.clip(link_ends, 0, len(nodes) - 1)]
+    keep = np.flatnonzero(in_range & (renumbered >= 0).all(axis=1))
+    logger.debug(
+        f"Pruned {len(nodes)} nodes and {len(links)} links to {count} and {len(keep)}"
+    )
+
+    return {
+        "full_name": chart_data.get("full_name"),
+        "symbol": chart_data.get("symbol"),
+        "chain": chart_data.get("chain"),
+        "dt_update": chart_data.get("dt_update"),
+        "nodes": [
+            {
+                key: nodes[i].get(key)
+                for key in ("address", "name", "amount", "is_contract", "percentage")
+            }
+            for i in top.tolist()
+        ],
+        "links": [
+            {
+                "source": source,
+                "target": target,
+                "forward": links[i].get("forward") or 0,
+                "backward": links[i].get("backward") or 0,
+            }
+            for i, (source, target) in zip(keep.tolist(), renumbered[keep].tolist())
+        ],
+    }
+
+
+# Decimal places kept per node column in compact payloads; other numbers keep six
+# significant digits
+COMPACT_DECIMALS = {"x": 1, "y": 1, "percentage": 3}
+
+
+def _compact_number(value: float | None, decimals: int | None = None):
+    if value is None:
+        return None
+    if decimals is not None:
+        return round(value, decimals)
+    return float(f"{value:.6g}")
+
+
+def compact_chart(chart_data: dict | None, node_fields: tuple[str, ...]) -> dict | None:
+    """Convert a map-data payload to the columnar form read by
+    static/expand_chart.js: one array per node field and per link attribute, with
+    only `node_fields` kept and numbers rounded."""
+    if not chart_data:
+        return chart_data
+
+    nodes = chart_data.get("nodes") or []
+    node_columns = {}
+    for field in node_fields:
+        column = [node.get(field) for node in nodes]
+        if field == "is_contract":
+            column = [int(bool(value)) for value in column]
+        elif field not in ("address", "name"):
+            decimals = COMPACT_DECIMALS.get(field)
+            column = [_compact_number(value, decimals) for value in column]
+        node_columns[field] = column
+
+    links = chart_data.get("links") or []
+    return {
+        "meta": {
+            key: chart_data.get(key)
+            for key in ("full_name", "symbol", "chain", "dt_update")
+        },
+        "nodes": node_columns,
+        "links": {
+            "source": [link["source"] for link in links],
+            "target": [link["target"] for link in links],
+            "forward": [_compact_number(link.get("forward") or 0) for link in links],
+            "backward": [_compact_number(link.get("backward") or 0) for link in links],
+        },
+    }
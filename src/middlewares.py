@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from logger import get_logger
+
+# Set up logging
+logger = get_logger()
+
+
+class UpdateSlot:
+    """One of ConcurrencyLimitMiddleware's slots, held by the update being handled."""
+
+    def __init__(self, semaphore: asyncio.Semaphore) -> None:
+        self._semaphore = semaphore
+        self.held = False
+
+    async def acquire(self) -> None:
+        await self._semaphore.acquire()
+        self.held = True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self._semaphore.release()
+
+
+_current_slot: ContextVar[UpdateSlot | None] = ContextVar("update_slot", default=None)
+
+
+@asynccontextmanager
+async def released_update_slot() -> AsyncIterator[None]:
+    """Give up the current update's slot while waiting on work that is bounded
+    elsewhere, such as a render job, and take one again afterwards."""
+    slot = _current_slot.get()
+    if slot is None or not slot.held:
+        yield
+        return
+    slot.release()
+    try:
+        yield
+    finally:
+        await slot.acquire()
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Cap how many updates are handled at once.
+
+    Both polling and the webhook server hand each update to its own task, so
+    without a cap a burst of updates runs every handler at the same time. Time a
+    handler spends inside `released_update_slot`, like waiting on the render queue,
+    doesn't count against the cap.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if self._semaphore.locked():
+            logger.debug(f"All {self.limit} update slots busy, waiting")
+        slot = UpdateSlot(self._semaphore)
+        await slot.acquire()
+        token = _current_slot.set(slot)
+        try:
+            return await handler(event, data)
+        finally:
+            _current_slot.reset(token)
+            slot.release()
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import math
+import os
+import pickle
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+
+from cache import TieredCache
+from jobs import RenderQueue
+from logger import get_logger
+from service_types import RequestPriority, TelegramCommand
+from settings import PrerenderSettings
+
+# Set up logging
+logger = get_logger()
+
+
+class PopularityTracker(ABC):
+    """Request counts per token that decay exponentially with `half_life`, plus a
+    lease deciding which process runs each pre-render cycle."""
+
+    def __init__(self, half_life: float, max_size: int) -> None:
+        self.max_size = max_size
+        self._rate = math.log(2) / half_life
+
+    @abstractmethod
+    async def record(self, chain: str, contract_address: str) -> None:
+        """Count a request for the token."""
+
+    @abstractmethod
+    async def top(self, count: int, min_score: float = 0) -> list[tuple[str, str]]:
+        """The `count` most requested (chain, contract_address) pairs scoring at
+        least `min_score`, most popular first."""
+
+    @abstractmethod
+    async def claim_cycle(self, duration: float) -> bool:
+        """Whether this process should run the pre-render cycle due now."""
+
+
+class MemoryPopularityTracker(PopularityTracker):
+    """Popularity local to this process.
+
+    Scores are kept with the time they were last updated and decayed lazily, so
+    nothing has to be swept as time passes. Once more than `max_size` tokens are
+    tracked the least popular one is dropped.
+    """
+
+    def __init__(self, half_life: float, max_size: int) -> None:
+        super().__init__(half_life, max_size)
+        self._scores: dict[tuple[str, str], tuple[float, float]] = {}
+
+    def _score(self, entry: tuple[float, float], now: float) -> float:
+        score, updated_at = entry
+        return score * math.exp(-self._rate * (now - updated_at))
+
+    async def record(self, chain: str, contract_address: str) -> None:
+        now = time.monotonic()
+        key = (chain, contract_address)
+        entry = self._scores.get(key)
+        self._scores[key] = ((self._score(entry, now) if entry else 0) + 1, now)
+        if len(self._scores) > self.max_size:
+            coldest = min(self._scores, key=lambda k: self._score(self._scores[k], now))
+            del self._scores[coldest]
+
+    async def top(self, count: int, min_score: float = 0) -> list[tuple[str, str]]:
+        now = time.monotonic()
+        scores = [(self._score(entry, now), key) for key, entry in self._scores.items()]
+        scores.sort(reverse=True)
+        return [key for score, key in scores[:count] if score >= min_score]
+
+    async def claim_cycle(self, duration: float) -> bool:
+        return True
+
+
+class SqlitePopularityTracker(PopularityTracker):
+    """Popularity kept in a sqlite file, so every process using the same file
+    counts requests together and only one of them runs each pre-render cycle.
+
+    Each token stores `weight = ln(score) + rate * updated_at`. Every score decays
+    at the same rate, so ordering by weight orders by current score, and neither
+    ranking nor eviction has to touch other rows' scores.
+    """
+
+    def __init__(self, path: str, half_life: float, max_size: int) -> None:
+        super().__init__(half_life, max_size)
+        self.path = path
+        self.holder = str(os.getpid())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS popularity (chain TEXT, "
+                "contract_address TEXT, weight REAL, "
+                "PRIMARY KEY (chain, contract_address))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS popularity_weight ON popularity (weight)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(name TEXT PRIMARY KEY, holder TEXT, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _record(self, chain: str, contract_address: str) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT weight FROM popularity "
+                "WHERE chain = ? AND contract_address = ?",
+                (chain, contract_address),
+            ).fetchone()
+            score = (math.exp(row[0] - self._rate * now) if row else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO popularity VALUES (?, ?, ?)",
+                (chain, contract_address, math.log(score) + self._rate * now),
+            )
+            conn.execute(
+                "DELETE FROM popularity WHERE rowid IN (SELECT rowid FROM popularity "
+                "ORDER BY weight DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            conn.execute("COMMIT")
+
+    def _top(self, count: int, min_score: float) -> list[tuple[str, str]]:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT chain, contract_address, weight FROM popularity "
+                "ORDER BY weight DESC LIMIT ?",
+                (count,),
+            ).fetchall()
+        return [
+            (chain, contract_address)
+            for chain, contract_address, weight in rows
+            if math.exp(weight - self._rate * now) >= min_score
+        ]
+
+    def _claim_cycle(self, duration: float) -> bool:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO leases VALUES ('prerender', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, "
+                "expires_at = excluded.expires_at WHERE leases.expires_at <= ?",
+                (self.holder, now + duration, now),
+            )
+            return cursor.rowcount > 0
+
+    async def record(self, chain: str, contract_address: str) -> None:
+        await asyncio.to_thread(self._record, chain, contract_address)
+
+    async def top(self, count: int, min_score: float = 0) -> list[tuple[str, str]]:
+        return await asyncio.to_thread(self._top, count, min_score)
+
+    async def claim_cycle(self, duration: float) -> bool:
+        return await asyncio.to_thread(self._claim_cycle, duration)
+
+
+def create_popularity_tracker(settings: PrerenderSettings) -> PopularityTracker:
+    if settings.prerender_db_path:
+        logger.info(f"Sharing token popularity through {settings.prerender_db_path}")
+        return SqlitePopularityTracker(
+            settings.prerender_db_path,
+            settings.prerender_half_life,
+            settings.prerender_max_tracked,
+        )
+    return MemoryPopularityTracker(
+        settings.prerender_half_life, settings.prerender_max_tracked
+    )
+
+
+def dump_card(card: TelegramCommand) -> str:
+    """Serialise a card for the card cache. The models' field serializers format
+    prices and volumes for display, so the JSON dump doesn't validate back; the
+    model is pickled with its raw values instead."""
+    return base64.b64encode(pickle.dumps(card)).decode()
+
+
+def load_card(data: str) -> TelegramCommand:
+    return pickle.loads(base64.b64decode(data))
+
+
+class Prerenderer:
+    """Keep token cards for the most requested tokens rendered ahead of time.
+
+    Every `prerender_interval` seconds the top tokens are re-rendered through the
+    render queue at background priority, one job at a time, until the cycle's job
+    or render time budget runs out. Finished cards are stored for
+    `prerender_card_ttl`, and requests for a token with a stored card are answered
+    from it without touching CoinGecko, Bubblemaps or Chromium.
+    """
+
+    def __init__(self, settings: PrerenderSettings, render_queue: RenderQueue) -> None:
+        self.settings = settings
+        self.render_queue = render_queue
+        self.popularity = create_popularity_tracker(settings)
+        self.cards = TieredCache(
+            settings.prerender_cache_size,
+            directory=settings.prerender_cache_dir,
+            disk_max_size=settings.prerender_cache_disk_size,
+        )
+        self._task: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(contract_address: str, chain: str) -> str:
+        return f"token_card:{chain}:{contract_address}"
+
+    async def record(self, contract_address: str, chain: str) -> None:
+        if not self.settings.prerender_enabled:
+            return
+        try:
+            await self.popularity.record(chain, contract_address)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record token request: {str(e)}")
+
+    async def get_card(
+        self, contract_address: str, chain: str
+    ) -> TelegramCommand | None:
+        if not self.settings.prerender_enabled:
+            return None
+        data = await self.cards.get(self._key(contract_address, chain))
+        if data is None:
+            return None
+        try:
+            card = load_card(data)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable pre-rendered card: {str(e)}")
+            return None
+        logger.info(f"Answering {chain}/{contract_address} from a pre-rendered card")
+        return card
+
+    async def refresh(self) -> None:
+        """Run one pre-render cycle within the configured budget."""
+        settings = self.settings
+        # Processes sharing a popularity file take turns, so a cycle and its
+        # budget run once per interval across all of them
+        if not await self.popularity.claim_cycle(0.9 * settings.prerender_interval):
+            logger.debug("Another process is running this pre-render cycle")
+            return
+        hot = await self.popularity.top(
+            settings.prerender_top_k, settings.prerender_min_score
+        )
+        if not hot:
+            return
+
+        jobs = 0
+        render_time = 0.0
+        rendered = 0
+        for chain, contract_address in hot:
+            if (
+                jobs >= settings.prerender_job_budget
+                or render_time >= settings.prerender_render_budget
+            ):
+                logger.info("Pre-render budget spent, deferring remaining tokens")
+                break
+
+            submitted, err = self.render_queue.submit(
+                "token_card",
+                contract_address=contract_address,
+                chain=chain,
+                priority=RequestPriority.BACKGROUND,
+            )
+            if err:
+                # Users come first; try again next cycle
+                logger.info(f"Skipping pre-render cycle: {err.message}")
+                break
+            future, _ = submitted
+            jobs += 1
+            started = time.perf_counter()
+            try:
+                # Shielded, as a user request for the same token may share the job
+                card = await asyncio.shield(future)
+            except Exception as e:
+                logger.warning(
+                    f"Pre-render failed for {chain}/{contract_address}: {str(e)}"
+                )
+                continue
+            finally:
+                render_time += time.perf_counter() - started
+            if card is None or card.screenshot_key is None:
+                # No card, or one built from an incomplete render
+                continue
+            await self.cards.set(
+                self._key(contract_address, chain),
+                dump_card(card),
+                settings.prerender_card_ttl,
+            )
+            rendered += 1
+
+        logger.info(
+            "Pre-rendered %s of %s hot tokens (%s jobs, %.1fs rendering)",
+            rendered,
+            len(hot),
+            jobs,
+            render_time,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.prerender_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Pre-render cycle failed: {str(e)}")
+
+    def start(self) -> None:
+        if self.settings.prerender_enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
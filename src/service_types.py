@@ -1,5 +1,5 @@
 from datetime import datetime
-from enum import StrEnum
+from enum import IntEnum, StrEnum
 from typing import Optional
 
 from aiogram.fsm.state import State, StatesGroup
@@ -33,6 +33,13 @@ CHAIN_MAPPING = {
 }
 
 
+class RequestPriority(IntEnum):
+    """Rate limiter lanes, served lowest value first"""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
 class TokenSelection(StatesGroup):
     waiting_for_selection = State()
 
@@ -105,9 +112,19 @@ class TokenCoinData(Base):
 
 
 class TelegramCommand(Base):
-    token_metrics: TokenMetrics
+    token_metrics: Optional[TokenMetrics] = None
     token_data: TokenCoinData
     screenshot_url: str
+    # Content hash of the rendered card, identifying the image across replies
+    screenshot_key: Optional[str] = None
+
+
+class RenderedImage(Base):
+    key: str
+    url: Optional[str] = None
+    image: Optional[bytes] = None
+    # False when the page never signalled it finished drawing
+    complete: bool = True
 
 
 class CoinGeckoSearch(Base):
@@ -1,27 +1,56 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING
+import gzip
+import json
+import time
+from datetime import datetime, timezone
+from functools import cache
+from typing import TYPE_CHECKING, AsyncIterator
 from urllib.parse import urlencode
 
 import numpy as np
-from playwright.async_api import async_playwright
-
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from browser import browser_manager
+from bubble_renderer import RENDERER_VERSION, TITLE_HEIGHT, render_bubble_map
+from cache import SingleFlight, TieredCache, content_hash
+from coin_index import coin_index
+from images import image_pipeline
+from layout import (LAYOUT_HEIGHT, LAYOUT_WIDTH, apply_layout, compact_chart,
+                    top_traders)
 from logger import get_logger
-from service_types import (CoinGeckoSearch, Error, TelegramCommand,
-                           TokenCoinData, TokenCommunityData, TokenMetrics,
-                           error)
+from service_types import (CoinGeckoSearch, Error, RenderedImage,
+                           RequestPriority, TelegramCommand, TokenCoinData,
+                           TokenCommunityData, TokenMetrics, error)
+from settings import CacheSettings, PipelineSettings
 from utils import (AsyncRequestSession, CoinGeckoRateLimiter,
-                   reduce_image_size, render_html_template, return_base_dir,
-                   send_request)
+                   render_html_template_async, return_base_dir, send_request)
 
 if TYPE_CHECKING:
+    from ibm_storage import AsyncIBMStorage
     from settings import CoinGeckoAPISettings
 
 # Set up logging
 logger = get_logger()
 
 COIN_GECKO_RATE_LIMITER = CoinGeckoRateLimiter()
+PIPELINE_SETTINGS = PipelineSettings()
+CACHE_SETTINGS = CacheSettings()
+BUBBLE_MAP_CACHE = TieredCache(
+    CACHE_SETTINGS.bubblemaps_cache_size,
+    directory=CACHE_SETTINGS.bubblemaps_cache_dir,
+    disk_max_size=CACHE_SETTINGS.bubblemaps_cache_disk_size,
+)
+RENDER_CACHE = TieredCache(
+    CACHE_SETTINGS.render_cache_size,
+    directory=CACHE_SETTINGS.render_cache_dir,
+    disk_max_size=CACHE_SETTINGS.render_cache_disk_size,
+)
+# /bi and /bm jobs for the same token fetch the same Bubblemaps payloads
+BUBBLE_MAP_REQUESTS = SingleFlight()
+# Bump when the rendering pipeline changes in a way templates don't capture
+RENDER_CACHE_VERSION = "1"
 
 BUBBLE_MAPS_API_URL = "https://api-legacy.bubblemaps.io"
 ELEMENTS_TO_REMOVE = [
@@ -33,14 +62,57 @@ ELEMENTS_TO_REMOVE = [
 TOKEN_TEMPLATE_PATH = "../static/token.html"
 BUBBLE_MAP_TEMPLATE = "../static/bubble_map.html"
 TOP_TRADERS_TEMPLATE = "../static/top_traders.html"
+TOP_TRADER_COUNT = 100
+BUBBLE_MAP_NODE_FIELDS = ("address", "name", "amount", "x", "y")
+TOP_TRADER_NODE_FIELDS = ("address", "name", "amount", "is_contract", "percentage")
+# Rendered images are stored under content-addressed names, so never change
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PAGE_CACHE_CONTROL = "public, max-age=300"
+BUBBLE_MAP_ASSET_PATH = "/assets/bubble-map.jpg"
+RENDER_COMPLETE_SELECTOR = 'body[data-render-complete="true"]'
 COINGECKO_SEARCH_API_URL = (
     "https://api.coingecko.com/api/v3/search?query={token_symbol}"
 )
 COINGECKO_GET_TOKEN_URL = "https://api.coingecko.com/api/v3/coins/{token_id}"
+CANDIDATE_CONCURRENCY = 5
+MAX_RETRIES = 2
+
+
+def bubble_map_ttl(data: dict) -> float:
+    """Seconds until Bubblemaps is next expected to refresh this payload, going by
+    its dt_update timestamp."""
+    min_ttl = CACHE_SETTINGS.bubblemaps_min_ttl
+    refresh_interval = CACHE_SETTINGS.bubblemaps_refresh_interval
+    try:
+        updated = datetime.fromisoformat(str(data["dt_update"]))
+    except (KeyError, ValueError):
+        return min_ttl
+    if updated.tzinfo is None:
+        updated = updated.replace(tzinfo=timezone.utc)
+    ttl = updated.timestamp() + refresh_interval - time.time()
+    return min(max(ttl, min_ttl), refresh_interval)
 
 
 async def bubble_map(path: str, *, contract_address: str, chain: str) -> dict[str, any]:
+    # Concurrent callers share one fetch, and each parses its own copy of the
+    # payload since callers go on to modify it
+    payload = await BUBBLE_MAP_REQUESTS.do(
+        (path, chain, contract_address),
+        lambda: fetch_bubble_map(path, contract_address=contract_address, chain=chain),
+    )
+    return json.loads(payload) if payload is not None else None
+
+
+async def fetch_bubble_map(
+    path: str, *, contract_address: str, chain: str
+) -> str | None:
     logger.info(f"Requesting bubble map data for {path}: {chain}/{contract_address}")
+    cache_key = f"{path}:{chain}:{contract_address}"
+    cached = await BUBBLE_MAP_CACHE.get(cache_key)
+    if cached is not None:
+        logger.info(f"Bubble map cache hit for {cache_key}")
+        return cached
+
     qparams = {
         "chain": chain,
         "token": contract_address,
@@ -56,8 +128,10 @@ async def bubble_map(path: str, *, contract_address: str, chain: str) -> dict[st
         if data.get("message") == "Data not available for this token":
             logger.warning(f"No data available for token {contract_address} on {chain}")
             return None
-        logger.debug(f"Received bubble map data from {path}: {len(str(data))} bytes")
-        return data
+        logger.debug(f"Received bubble map data from {path}: {len(response.text)} bytes")
+        if response.status_code == 200:
+            await BUBBLE_MAP_CACHE.set(cache_key, response.text, bubble_map_ttl(data))
+        return response.text
     except Exception as e:
         logger.error(f"Error getting bubble map data for {path}: {str(e)}")
         raise
@@ -103,12 +177,18 @@ async def get_decentralization_score(
         raise
 
 
-async def get_token_data(*, contract_address: str, chain: str):
+async def get_token_data(
+    *,
+    contract_address: str,
+    chain: str,
+    priority: RequestPriority = RequestPriority.INTERACTIVE,
+):
     logger.info(f"Getting token data from CoinGecko: {chain}/{contract_address}")
     url = f"https://api.coingecko.com/api/v3/coins/{chain}/contract/{contract_address}"
     logger.debug(f"CoinGecko URL: {url}")
 
     try:
+        await COIN_GECKO_RATE_LIMITER.acquire(priority)
         response = await send_request(url)
         if response.status_code != 200:
             logger.warning(f"Failed to get token data: HTTP {response.status_code}")
@@ -167,153 +247,188 @@ async def get_token_data(*, contract_address: str, chain: str):
 
 
 async def capture_screenshot(page, selector: str | None = None) -> bytes:
-    """Capture a high-resolution 4K screenshot of the page or specific element."""
+    """Capture the page or a specific element, encoded straight to the output
+    format by the browser."""
+    started = time.perf_counter()
     try:
         # Try to capture screenshot of a specific element
         if selector and page.locator(str(selector)):
             screenshot_bytes = await page.locator(selector).screenshot(
-                type="png",
-                omit_background=True,  # Transparent background if needed
-                scale="css",  # Use CSS pixels for consistent sizing
+                **image_pipeline.screenshot_options
             )
-            logger.info(f"Screenshot captured: {len(screenshot_bytes)} bytes")
-            return screenshot_bytes
         else:
             # If element not found, capture full page screenshot
             screenshot_bytes = await page.screenshot(
-                type="png",
-                omit_background=True,  # Transparent background if needed
-                scale="css",  # Use CSS pixels for consistent sizing
-            )
-            logger.info(
-                f"Screenshot captured (full page): {len(screenshot_bytes)} bytes"
+                **image_pipeline.screenshot_options
             )
-            return screenshot_bytes
+        logger.info(
+            "Screenshot captured in %.0fms: %s bytes",
+            (time.perf_counter() - started) * 1000,
+            len(screenshot_bytes),
+        )
+        return screenshot_bytes
     except Exception as e:
         logger.error(f"Error during screenshot capture: {str(e)}")
         raise
 
 
+async def wait_for_render_complete(page, timeout: int) -> bool:
+    """Wait for the page to flag that it finished drawing, capped at `timeout` ms.
+    Returns whether it did."""
+    try:
+        await page.wait_for_selector(
+            RENDER_COMPLETE_SELECTOR, state="attached", timeout=timeout
+        )
+        logger.debug("Page signalled render complete")
+        return True
+    except PlaywrightTimeoutError:
+        logger.warning(
+            f"Page did not signal render complete within {timeout}ms, capturing anyway"
+        )
+        return False
+
+
 async def get_page_screenshot(
-    url, sleep: int | None = None, selector: str | None = None
-) -> bytes:
-    """Generate a high-resolution 4K screenshot of the bubble map and return as bytes"""
+    url, wait_for_ready: bool = False, selector: str | None = None
+) -> tuple[bytes, bool]:
+    """Generate a high-resolution 4K screenshot of the bubble map and return it as
+    bytes, along with whether the page signalled it finished rendering"""
     logger.info("Generating bubble map screenshot for %s", url)
 
     try:
-        async with async_playwright() as p:
-            logger.debug("Launching Playwright browser")
-            # Launch browser with higher default viewport for better quality
-            browser = await p.chromium.launch(channel="chromium", headless=True)
-            context = await browser.new_context(
-                viewport={
-                    "width": 1080,
-                    "height": 1080,
-                    "deviceScaleFactor": 2,  # Higher pixel density
-                }
+        async with browser_manager.page() as page:
+            # Navigate to the page
+            logger.debug(f"Navigating to: {url}")
+            await page.goto(
+                url,
+                timeout=60000,  # Longer timeout for high-res loading
             )
-            page = await context.new_page()
-
-            try:
-                # Navigate to the page
-                logger.debug(f"Navigating to: {url}")
-                await page.goto(
-                    url,
-                    timeout=60000,  # Longer timeout for high-res loading
+
+            complete = True
+            if wait_for_ready:
+                complete = await wait_for_render_complete(
+                    page, browser_manager.settings.browser_ready_timeout_ms
                 )
 
-                # Wait for the page to load before proceeding (sleep)
-                if sleep:
-                    await asyncio.sleep(sleep)
+            # Capture the screenshot of the page or element
+            return await capture_screenshot(page, selector=selector), complete
+    except Exception as e:
+        logger.error(f"Playwright error: {str(e)}")
+        raise
 
-                # Capture the screenshot of the page or element
-                screenshot_bytes = await capture_screenshot(page, selector=selector)
 
-                return screenshot_bytes
+async def get_html_screenshot(
+    html: str,
+    wait_for_ready: bool = False,
+    selector: str | None = None,
+    assets: dict[str, tuple[bytes, str]] | None = None,
+) -> tuple[bytes, bool]:
+    """Screenshot rendered HTML loaded straight into a pooled page, with no upload
+    or remote page load in between. Returns the capture and whether the page
+    signalled it finished rendering, which is always True without `wait_for_ready`"""
+    logger.info("Generating in-process screenshot")
 
-            except Exception as e:
-                logger.error(f"Error during screenshot capture: {str(e)}")
-                raise
+    try:
+        async with browser_manager.rendered_page(html, assets=assets) as page:
+            complete = True
+            if wait_for_ready:
+                complete = await wait_for_render_complete(
+                    page, browser_manager.settings.browser_ready_timeout_ms
+                )
 
-            finally:
-                # Ensure browser is closed even if errors occur
-                logger.debug("Closing browser")
-                await context.close()
-                await browser.close()
+            # Capture the screenshot of the page or element
+            return await capture_screenshot(page, selector=selector), complete
     except Exception as e:
         logger.error(f"Playwright error: {str(e)}")
         raise
 
 
-async def process_batch(
-    session: AsyncRequestSession, batch: list[CoinGeckoSearch], chain: str
-) -> list[CoinGeckoSearch]:
-    batch_results = []
-    MAX_RETRIES = 2
-
-    async def fetch_token(
-        token: CoinGeckoSearch,
-    ) -> tuple[CoinGeckoSearch | None, error]:
-        for attempt in range(MAX_RETRIES + 1):
-            await COIN_GECKO_RATE_LIMITER.acquire()
-            url = COINGECKO_GET_TOKEN_URL.format(token_id=token.coin_gecko_id)
-            res = await session.get(url)
-            if res.status_code == 429:
-                wait = int(res.headers.get("Retry-After", 10))
-                logger.debug(f"Rate limit hit, waiting {wait}s")
-                await asyncio.sleep(wait)
-                continue
-            if res.status_code != 200:
-                return None, Error(res.content)
-            data = res.json()
-            contract_address = data.get("platforms", None).get(chain, None)
-            if contract_address is None:
-                return None, Error("Contract address not found")
-            token.chain = chain
-            token.contract_address = contract_address
-            return token, None
-        if attempt == MAX_RETRIES:
-            return None, Error(f"Failed after {MAX_RETRIES} retries: {attempt}")
-        await asyncio.sleep(2**attempt)
-
-    tasks = [fetch_token(token) for token in batch]
-    results = await asyncio.gather(*tasks)
-
-    # Separate results and errors
-    for token, err in results:
-        if err:
-            logger.error("Error: %s", err.message)
+async def fetch_token_contract(
+    session: AsyncRequestSession, token: CoinGeckoSearch, chain: str
+) -> tuple[CoinGeckoSearch | None, error]:
+    """Look up a candidate's contract on `chain`, backing off on 429s and 5xx."""
+    url = COINGECKO_GET_TOKEN_URL.format(token_id=token.coin_gecko_id)
+    for attempt in range(MAX_RETRIES + 1):
+        await COIN_GECKO_RATE_LIMITER.acquire()
+        res = await session.get(url)
+        if res.status_code == 429 or res.status_code >= 500:
+            wait = int(res.headers.get("Retry-After", 2**attempt))
+            logger.debug(f"HTTP {res.status_code} for {url}, retrying in {wait}s")
+            await asyncio.sleep(wait)
             continue
-        batch_results.append(token)
-
-    return batch_results
+        if res.status_code != 200:
+            return None, Error(res.content)
+        data = res.json()
+        contract_address = (data.get("platforms") or {}).get(chain, None)
+        if not contract_address:
+            return None, Error("Contract address not found")
+        token.chain = chain
+        token.contract_address = contract_address
+        return token, None
+    return None, Error(f"Failed after {MAX_RETRIES} retries: {token.coin_gecko_id}")
 
 
 async def filter_by_chain(
     session, *, data: list[CoinGeckoSearch], chain: str
-) -> tuple[CoinGeckoSearch | None]:
-    BATCH_SIZE = 5
-    all_results = []
-    for i in range(0, len(data), BATCH_SIZE):
-        batch = data[i : i + BATCH_SIZE]
-        results = await process_batch(session, batch, chain)
-        if len(results) == 0:
-            continue
-        all_results.extend([result for items in results for result in results])
-    return all_results
-
+) -> AsyncIterator[CoinGeckoSearch]:
+    """Yield each candidate listed on `chain` as soon as its lookup completes, keeping
+    at most CANDIDATE_CONCURRENCY lookups in flight."""
+    candidates = iter(data)
+    pending: set[asyncio.Task] = set()
+
+    def fill():
+        while len(pending) < CANDIDATE_CONCURRENCY:
+            token = next(candidates, None)
+            if token is None:
+                return
+            pending.add(
+                asyncio.create_task(fetch_token_contract(session, token, chain))
+            )
 
-async def search_token(
+    try:
+        fill()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            fill()
+            for task in done:
+                token, err = task.result()
+                if err:
+                    logger.error("Error: %s", err.message)
+                    continue
+                yield token
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def search_token_stream(
     coin_gecko_api_key: str, *, symbol: str, chain: str
-) -> tuple[list[CoinGeckoSearch], error]:
+) -> AsyncIterator[CoinGeckoSearch]:
+    """Yield tokens matching `symbol` on `chain` as they are resolved.
+
+    Raises Error if the CoinGecko search itself fails.
+    """
+    # Answer from the local index when it knows the symbol; fall back to the
+    # search API for coins listed since the last refresh
+    if candidates := coin_index.lookup(symbol, chain):
+        logger.info(f"Resolved ${symbol} on {chain} from the coin index")
+        for candidate in candidates:
+            yield candidate
+        return
+
     async with AsyncRequestSession(
         headers={"x-cg-demo-api-key": coin_gecko_api_key}
     ) as session:
         url = COINGECKO_SEARCH_API_URL.format(token_symbol=symbol)
+        await COIN_GECKO_RATE_LIMITER.acquire()
         response = await session.get(url)
         if response.status_code != 200:
-            return None, Error(f"Error: {response.content}")
+            raise Error(f"Error: {response.content}")
         data = response.json()
+        if not data["coins"]:
+            return
         coins_array = np.array(
             [(coin["id"], coin["symbol"], coin["name"]) for coin in data["coins"]]
         )
@@ -327,80 +442,270 @@ async def search_token(
             )
             for coin in filtered_coins
         ]
-        return await filter_by_chain(session, data=result, chain=chain), None
+        async for token in filter_by_chain(session, data=result, chain=chain):
+            yield token
 
 
-async def run(contract_address: str, chain: str, ibm_storage: IBMStorage):
-    logger.info(f"Starting bubble map generation for {chain}/{contract_address}")
+async def search_token(
+    coin_gecko_api_key: str, *, symbol: str, chain: str
+) -> tuple[list[CoinGeckoSearch], error]:
     try:
-        token = {"contract_address": contract_address, "chain": chain}
+        return [
+            token
+            async for token in search_token_stream(
+                coin_gecko_api_key, symbol=symbol, chain=chain
+            )
+        ], None
+    except Error as e:
+        return None, e
 
-        logger.info("Getting token data")
-        token_data = await get_token_data(**token)
-        if not token_data:
-            logger.error("Failed to get token data, aborting")
-            return None, None, None
 
-        logger.info("Getting decentralization metrics")
-        token_metrics = await get_decentralization_score(**token)
-        if not token_metrics:
-            logger.warning("Decentralization metrics not available")
+async def run_stage(name: str, coro, timeout: float, required: bool = True):
+    """Await one pipeline stage under a timeout. Optional stages log and yield None
+    on failure so the rest of the pipeline can carry on without them."""
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except Exception as e:
+        if required:
+            logger.error(f"Stage '{name}' failed: {e!r}")
+            raise
+        logger.warning(f"Stage '{name}' failed, continuing without it: {e!r}")
+        return None
 
-        logger.info("Generating and uploading bubble map screenshot")
-        token_chart = await get_token_bubble_map(
-            contract_address=contract_address, chain=chain
-        )
-        html_data = render_html_template(BUBBLE_MAP_TEMPLATE, chart_data=token_chart)
-        url, _ = ibm_storage.upload_bytes(
-            html_data.encode(), f"{chain}-{contract_address}.html", "bubble-map-pages"
+
+async def upload_image(
+    ibm_storage: AsyncIBMStorage, data: bytes, object_name: str, folder_path: str
+) -> str | None:
+    logger.debug(f"Uploading screenshot as {object_name}")
+    url, err = await ibm_storage.upload_bytes(
+        data,
+        object_name,
+        folder_path,
+        content_type=image_pipeline.content_type,
+        cache_control=IMAGE_CACHE_CONTROL,
+    )
+    if err:
+        logger.info(err.message)
+        return None
+    logger.info(f"Screenshot uploaded successfully: {url}")
+    return url
+
+
+@cache
+def template_digest(template_path: str) -> str:
+    """Hash of a template's source, so edits to it invalidate cached renders."""
+    with open(template_path, "rb") as f:
+        return content_hash(RENDER_CACHE_VERSION, f.read())
+
+
+def card_key_inputs(
+    token_data: TokenCoinData, token_metrics: TokenMetrics | None
+) -> dict:
+    """The text token.html draws on the card, formatted as the template formats it.
+    Fields the card doesn't show are left out."""
+    inputs = {
+        "name": token_data.name,
+        "symbol": token_data.symbol,
+        "token_image_url": token_data.community_data.token_image_url,
+        "price": f"{token_data.price:,.0f}",
+        "market_cap": f"{token_data.market_cap:,.0f}",
+        "volume": str(token_data.volume),
+        "total_supply": f"{token_data.total_supply:,.0f}",
+        "circulating_supply": f"{token_data.circulating_supply:,.0f}",
+    }
+    if token_metrics:
+        supply = token_metrics.identified_supply
+        inputs["percent_in_cexs"] = f"{supply.percent_in_cexs * 100:.1f}"
+        inputs["percent_in_contracts"] = f"{supply.percent_in_contracts * 100:.1f}"
+    return inputs
+
+
+async def cache_render(
+    key: str,
+    upload,
+    ttl: float = CACHE_SETTINGS.render_cache_ttl,
+    complete: bool = True,
+) -> str | None:
+    """Await an image upload and remember its URL under the render's content key.
+    Incomplete renders are uploaded but never cached."""
+    url = await upload
+    if url and complete:
+        await RENDER_CACHE.set(key, url, ttl)
+    return url
+
+
+async def render_bubble_map_image(
+    *, contract_address: str, chain: str
+) -> RenderedImage | None:
+    """Render the bubble map, or return the URL of an identical earlier render."""
+    token_chart = await get_token_bubble_map(
+        contract_address=contract_address, chain=chain
+    )
+    if not token_chart:
+        return None
+    native = PIPELINE_SETTINGS.bubble_render_mode == "native"
+    if native:
+        renderer_digest = content_hash("native", RENDERER_VERSION)
+    else:
+        renderer_digest = template_digest(BUBBLE_MAP_TEMPLATE)
+    key = content_hash(renderer_digest, token_chart)
+    if url := await RENDER_CACHE.get(key):
+        logger.info(f"Bubble map render cache hit ({RENDER_CACHE.stats()})")
+        return RenderedImage(key=key, url=url)
+
+    token_chart = await asyncio.to_thread(apply_layout, token_chart)
+    if native:
+        started = time.perf_counter()
+        image = await image_pipeline.run(
+            render_bubble_map,
+            token_chart,
+            LAYOUT_WIDTH,
+            LAYOUT_HEIGHT + TITLE_HEIGHT,
+            image_pipeline.settings.image_format,
+            image_pipeline.settings.image_quality,
         )
-        screenshot_bytes = await get_page_screenshot(url, sleep=15)
-        screenshot_bytes_reduced = reduce_image_size(screenshot_bytes)
-        screenshot_filename = f"{chain}-{contract_address}.png"
-        logger.debug(f"Uploading screenshot as {screenshot_filename}")
-        bubble_map_screenshot_url, err = ibm_storage.upload_bytes(
-            screenshot_bytes_reduced,
-            screenshot_filename,
-            "bubble-map-image",
+        logger.info(
+            "Bubble map drawn natively in %.0fms: %s bytes",
+            (time.perf_counter() - started) * 1000,
+            len(image),
         )
-        if err:
-            logger.info(err.message)
+        return RenderedImage(key=key, image=image)
 
-        logger.info(f"Screenshot uploaded successfully: {bubble_map_screenshot_url}")
+    html_data = await render_html_template_async(
+        BUBBLE_MAP_TEMPLATE,
+        chart_data=compact_chart(token_chart, BUBBLE_MAP_NODE_FIELDS),
+    )
+    screenshot_bytes, complete = await get_html_screenshot(
+        html_data, wait_for_ready=True
+    )
+    image = await image_pipeline.process(screenshot_bytes, "bubble map")
+    return RenderedImage(key=key, image=image, complete=complete)
 
-        token_data.bubble_screenshot_url = bubble_map_screenshot_url
 
-        logger.info("Generating HTML page screenshot")
-        token_html = render_html_template(
-            TOKEN_TEMPLATE_PATH,
-            token=token_data,
-            metrics=token_metrics,
-            root_dir=return_base_dir(),
+async def run(
+    contract_address: str,
+    chain: str,
+    ibm_storage: AsyncIBMStorage,
+    priority: RequestPriority = RequestPriority.INTERACTIVE,
+):
+    """Build the /bi token card.
+
+    Token data, decentralization metrics and the bubble map image are fetched and
+    rendered concurrently; the card is rendered once all three have settled. Only the
+    token data is required, a missing metrics or bubble map stage leaves its section
+    out of the card. Renders are keyed by a hash of their inputs, so a card whose
+    inputs are unchanged is answered from the render cache without Chromium.
+    """
+    logger.info(f"Starting bubble map generation for {chain}/{contract_address}")
+    settings = PIPELINE_SETTINGS
+    token = {"contract_address": contract_address, "chain": chain}
+    tasks: list[asyncio.Task] = []
+    try:
+        token_data_task = asyncio.create_task(
+            run_stage(
+                "token data",
+                get_token_data(**token, priority=priority),
+                settings.token_data_timeout,
+            )
         )
-        page_url, _ = ibm_storage.upload_bytes(
-            token_html.encode(),
-            f"{chain}-{contract_address}.html",
-            "bubble-map-screenshot",
+        metrics_task = asyncio.create_task(
+            run_stage(
+                "decentralization metrics",
+                get_decentralization_score(**token),
+                settings.metrics_timeout,
+                required=False,
+            )
         )
-        # _ = save_html_as_screenshot(
-        #   ibm_storage,
-        #  data=token_data,
-        # metrics=token_metrics,
-        # html_parsed=token_html,
-        # save_file_name=screenshot_filename,
-        # )
-        page_screenshot = await get_page_screenshot(page_url, selector=".token-card")
-        screenshot_bytes_reduced = reduce_image_size(page_screenshot)
-        screenshot_filename = f"{chain}-{contract_address}.png"
-        logger.debug(f"Uploading screenshot as {screenshot_filename}")
-        token_page_screenshot_url, err = ibm_storage.upload_bytes(
-            screenshot_bytes_reduced,
-            screenshot_filename,
-            "bubble-map-screenshots",
+        bubble_map_task = asyncio.create_task(
+            run_stage(
+                "bubble map",
+                render_bubble_map_image(**token),
+                settings.bubble_map_timeout,
+                required=False,
+            )
         )
-        if err:
-            logger.info(err.message)
-        logger.info(f"HTML page screenshot generated: {token_page_screenshot_url}")
+        tasks.extend([token_data_task, metrics_task, bubble_map_task])
+
+        token_data = await token_data_task
+        if not token_data:
+            logger.error("Failed to get token data, aborting")
+            return None
+
+        token_metrics, bubble_map = await asyncio.gather(metrics_task, bubble_map_task)
+        if not token_metrics:
+            logger.warning("Decentralization metrics not available")
+
+        assets = {}
+        bubble_image_url = None
+        bubble_upload_task = None
+        if bubble_map is None:
+            logger.warning("Bubble map not available")
+        elif bubble_map.url:
+            token_data.bubble_screenshot_url = bubble_image_url = bubble_map.url
+        else:
+            bubble_upload_task = asyncio.create_task(
+                cache_render(
+                    bubble_map.key,
+                    upload_image(
+                        ibm_storage,
+                        bubble_map.image,
+                        f"{chain}-{contract_address}-{bubble_map.key[:16]}"
+                        f".{image_pipeline.extension}",
+                        "bubble-map-image",
+                    ),
+                    complete=bubble_map.complete,
+                )
+            )
+            tasks.append(bubble_upload_task)
+            # The card embeds the bubble map from memory rather than from COS
+            assets[BUBBLE_MAP_ASSET_PATH] = (
+                bubble_map.image,
+                image_pipeline.content_type,
+            )
+            bubble_image_url = BUBBLE_MAP_ASSET_PATH
+
+        # A card embedding an incomplete bubble map must not be reused by key
+        card_complete = bubble_map is None or bubble_map.complete
+        card_key = content_hash(
+            template_digest(TOKEN_TEMPLATE_PATH),
+            card_key_inputs(token_data, token_metrics),
+            bubble_map.key if bubble_map else None,
+        )
+        token_page_screenshot_url = await RENDER_CACHE.get(card_key)
+        if token_page_screenshot_url:
+            logger.info(f"Token card render cache hit ({RENDER_CACHE.stats()})")
+        else:
+            logger.info("Generating HTML page screenshot")
+            token_html = await render_html_template_async(
+                TOKEN_TEMPLATE_PATH,
+                token=token_data,
+                metrics=token_metrics,
+                root_dir=return_base_dir(),
+                bubble_image_url=bubble_image_url,
+            )
+            page_screenshot, _ = await run_stage(
+                "token card",
+                get_html_screenshot(token_html, selector=".token-card", assets=assets),
+                settings.token_card_timeout,
+            )
+            token_page_image = await image_pipeline.process(
+                page_screenshot, "token card"
+            )
+            token_page_screenshot_url = await cache_render(
+                card_key,
+                upload_image(
+                    ibm_storage,
+                    token_page_image,
+                    f"{chain}-{contract_address}-{card_key[:16]}"
+                    f".{image_pipeline.extension}",
+                    "bubble-map-screenshots",
+                ),
+                CACHE_SETTINGS.card_render_cache_ttl,
+                complete=card_complete,
+            )
+            logger.info(f"HTML page screenshot generated: {token_page_screenshot_url}")
+        if bubble_upload_task:
+            token_data.bubble_screenshot_url = await bubble_upload_task
 
         logger.info(
             f"Successfully completed bubble map processing for {chain}/{contract_address}"
@@ -409,34 +714,48 @@ async def run(contract_address: str, chain: str, ibm_storage: IBMStorage):
             token_data=token_data,
             token_metrics=token_metrics,
             screenshot_url=token_page_screenshot_url,
+            screenshot_key=card_key if card_complete else None,
         )
 
     except Exception as e:
         logger.error(f"Error during bubble map generation: {str(e)}")
         raise
+    finally:
+        for task in tasks:
+            task.cancel()
 
 
 async def top_traders_page_url(
-    contract_address: str, chain: str, ibm_storage: IBMStorage
+    contract_address: str, chain: str, ibm_storage: AsyncIBMStorage
 ):
     data = await get_token_bubble_map(contract_address=contract_address, chain=chain)
-    template = render_html_template(TOP_TRADERS_TEMPLATE, chart_data=data)
-    page_url, _ = ibm_storage.upload_bytes(
-        template.encode(),
+    # Only the pruned graph is embedded, rather than the whole map-data payload
+    data = await asyncio.to_thread(top_traders, data, TOP_TRADER_COUNT)
+    template = await render_html_template_async(
+        TOP_TRADERS_TEMPLATE,
+        chart_data=compact_chart(data, TOP_TRADER_NODE_FIELDS),
+    )
+    page = await asyncio.to_thread(gzip.compress, template.encode())
+    logger.debug(f"Top traders page: {len(template)} bytes, {len(page)} gzipped")
+    page_url, _ = await ibm_storage.upload_bytes(
+        page,
         f"{chain}-{contract_address}.html",
         "top-traders",
+        content_type="text/html; charset=utf-8",
+        content_encoding="gzip",
+        cache_control=PAGE_CACHE_CONTROL,
     )
     logger.info("HTML top traders page generated for %s-%s", chain, contract_address)
     return page_url
 
 
 if __name__ == "__main__":
-    from ibm_storage import IBMStorage
+    from ibm_storage import AsyncIBMStorage, IBMStorage
     from settings import CoinGeckoAPISettings, IBMSettings
 
     settings = IBMSettings()
     coinSettings = CoinGeckoAPISettings()
-    ibm_storage = IBMStorage(settings)
+    ibm_storage = AsyncIBMStorage(IBMStorage(settings))
     token = {
         "contract_address": "F28UWka8PSyG1jUtVZ2CfFdF1dkLEA4rw7GkFBW7pump",
         "chain": "sol",
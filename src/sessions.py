@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+
+from cache import TTLCache
+from logger import get_logger
+from settings import SessionSettings
+
+# Set up logging
+logger = get_logger()
+
+
+class SessionStore(ABC):
+    """Short-lived per-user state with a TTL on every entry and a cap on entries.
+
+    Values must be JSON-serialisable, so every backend stores the same data.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, key: str) -> Any | None:
+        """Return the value stored under `key`, or None if missing or expired."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store `value`, expiring after `ttl` seconds or the store's default."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove `key` if present."""
+
+    async def pop(self, key: str) -> Any | None:
+        value = await self.get(key)
+        if value is not None:
+            await self.delete(key)
+        return value
+
+    async def close(self) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Session store local to this process, evicting least recently used entries."""
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        super().__init__(max_size, ttl)
+        self._entries = TTLCache(max_size)
+
+    async def get(self, key: str) -> Any | None:
+        value = self._entries.get(key)
+        # Stored serialised, so callers can't mutate an entry in place
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self._entries.set(key, json.dumps(value), ttl or self.ttl)
+
+    async def delete(self, key: str) -> None:
+        self._entries.delete(key)
+
+
+class SqliteSessionStore(SessionStore):
+    """Session store kept in a sqlite file, so state survives restarts and is
+    visible to every process using the same file."""
+
+    def __init__(self, path: str, max_size: int, ttl: float) -> None:
+        super().__init__(max_size, ttl)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, "
+                "value TEXT, expires_at REAL, accessed_at REAL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_accessed_at "
+                "ON sessions (accessed_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _get(self, key: str) -> Any | None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE sessions SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM sessions WHERE key IN (SELECT key FROM sessions "
+                "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+
+    def _delete(self, key: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def _pop(self, key: str) -> Any | None:
+        # A single statement, so two processes can't both take the same entry
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "DELETE FROM sessions WHERE key = ? AND expires_at > ? RETURNING value",
+                (key, time.time()),
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+
+    async def get(self, key: str) -> Any | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl or self.ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def pop(self, key: str) -> Any | None:
+        return await asyncio.to_thread(self._pop, key)
+
+
+class SessionFSMStorage(BaseStorage):
+    """aiogram FSM storage backed by a SessionStore, so conversation state gets the
+    same TTL and size bounds as the rest of the session data."""
+
+    def __init__(self, store: SessionStore) -> None:
+        self.store = store
+
+    @staticmethod
+    def _key(key: StorageKey, part: str) -> str:
+        return (
+            f"fsm:{part}:{key.bot_id}:{key.chat_id}:{key.user_id}:"
+            f"{key.thread_id}:{key.business_connection_id}:{key.destiny}"
+        )
+
+    async def set_state(
+        self, key: StorageKey, state: str | State | None = None
+    ) -> None:
+        if state is None:
+            await self.store.delete(self._key(key, "state"))
+            return
+        if isinstance(state, State):
+            state = state.state
+        await self.store.set(self._key(key, "state"), state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self.store.get(self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not data:
+            await self.store.delete(self._key(key, "data"))
+            return
+        await self.store.set(self._key(key, "data"), dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return await self.store.get(self._key(key, "data")) or {}
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def create_session_store(settings: SessionSettings) -> SessionStore:
+    if settings.session_backend == "sqlite":
+        logger.info(f"Using sqlite session store at {settings.session_db_path}")
+        return SqliteSessionStore(
+            settings.session_db_path, settings.session_max_size, settings.session_ttl
+        )
+    return MemorySessionStore(settings.session_max_size, settings.session_ttl)
+
+
+session_store = create_session_store(SessionSettings())
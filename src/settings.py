@@ -1,10 +1,12 @@
 import os
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-from utils import return_base_dir
-
-env_dir = os.path.join(return_base_dir(), ".env")
+# Resolved here rather than through utils.return_base_dir, since utils itself
+# depends on settings
+base_dir = os.path.dirname(os.path.dirname(__file__))
+env_dir = os.path.join(base_dir, ".env")
 
 
 class AppSettings(BaseSettings):
@@ -15,15 +17,166 @@ class AppSettings(BaseSettings):
 
 class TelegramSettings(AppSettings):
     telegram_bot_token: str
+    # "webhook" serves updates over HTTP, so several instances can sit behind a
+    # load balancer
+    telegram_mode: Literal["polling", "webhook"] = "polling"
+    # Updates handled at once; time spent waiting on the render queue isn't counted
+    telegram_max_concurrent_updates: int = 32
+
+
+class WebhookSettings(AppSettings):
+    # Public base URL Telegram delivers to, e.g. https://bot.example.com
+    webhook_url: str | None = None
+    webhook_path: str = "/webhook"
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_secret: str | None = None
 
 
 class CoinGeckoAPISettings(AppSettings):
     coin_gecko_api_key: str
 
 
+class RateLimitSettings(AppSettings):
+    coingecko_rate_limit: int = 30
+    coingecko_rate_period: float = 60
+    coingecko_burst: int = 5
+    # Path to a sqlite file holding the bucket, to share the quota across processes
+    coingecko_rate_limit_db: str | None = None
+
+
+class CoinIndexSettings(AppSettings):
+    coin_index_path: str | None = os.path.join(base_dir, "data", "coin_index.json.gz")
+    coin_index_refresh_interval: float = 24 * 3600
+    coin_index_retry_interval: float = 15 * 60
+
+
 class IBMSettings(AppSettings):
     ibm_service_endpoint: str
     ibm_bucket_name: str
     ibm_bucket_instance_id: str
     ibm_api_key: str
+    ibm_upload_workers: int = 8
+    ibm_multipart_threshold: int = 8 * 1024 * 1024
+    ibm_multipart_chunksize: int = 8 * 1024 * 1024
+    ibm_max_concurrency: int = 4
+
+
+class BrowserSettings(AppSettings):
+    browser_pool_size: int = 2
+    browser_max_pages: int = 200
+    browser_memory_limit_mb: int = 1536
+    browser_memory_check_interval: float = 30
+    browser_viewport_width: int = 1080
+    browser_viewport_height: int = 1080
+    browser_ready_timeout_ms: int = 15000
+
+
+class PipelineSettings(AppSettings):
+    """Per-stage timeouts, in seconds, for the /bi pipeline in services.run"""
+
+    token_data_timeout: float = 20
+    metrics_timeout: float = 15
+    bubble_map_timeout: float = 60
+    token_card_timeout: float = 60
+    # "browser" screenshots static/bubble_map.html in Chromium; "native" draws the
+    # same /bi bubble map with Pillow, without a browser
+    bubble_render_mode: Literal["native", "browser"] = "browser"
+
+
+class ImageSettings(AppSettings):
+    # Playwright captures jpeg natively; webp output is re-encoded with Pillow
+    image_format: Literal["jpeg", "webp"] = "jpeg"
+    image_quality: int = 85
+    image_max_size: int = 1024
+    image_progressive: bool = False
+    image_workers: int = 2
+
+
+class RenderQueueSettings(AppSettings):
+    render_queue_size: int = 50
+    render_workers: int = 2
+    # "async" runs renders on the bot's event loop; "process" gives each worker its
+    # own process, event loop and browser
+    render_worker_mode: Literal["async", "process"] = "async"
+
+
+class SessionSettings(AppSettings):
+    # "sqlite" keeps sessions and FSM state in a file shared by every process
+    session_backend: Literal["memory", "sqlite"] = "memory"
+    session_db_path: str = os.path.join(base_dir, "data", "sessions.db")
+    session_max_size: int = 10000
+    session_ttl: float = 15 * 60
+
+
+class PrerenderSettings(AppSettings):
+    prerender_enabled: bool = True
+    # Token requests decay with this half-life, so popularity follows recent demand
+    prerender_half_life: float = 3600
+    prerender_min_score: float = 3
+    prerender_top_k: int = 10
+    prerender_max_tracked: int = 5000
+    prerender_interval: float = 300
+    # Per-cycle budget: token card jobs run, each making one CoinGecko contract
+    # lookup, and seconds spent waiting on renders
+    prerender_job_budget: int = 5
+    prerender_render_budget: float = 60
+    # How long a pre-rendered card may answer requests for its token. Its price,
+    # market cap and volume are at most this old, so keep it within the interval
+    prerender_card_ttl: float = 300
+    prerender_cache_size: int = 256
+    prerender_cache_dir: str | None = None
+    prerender_cache_disk_size: int = 1000
+    # Path to a sqlite file holding popularity, so several processes count requests
+    # together and take turns running cycles
+    prerender_db_path: str | None = None
+
+
+class SupervisorSettings(AppSettings):
+    supervisor_workers: int = 2
+    # Disk caches and the CoinGecko rate limit bucket live here when not configured
+    # explicitly, so every worker process shares them
+    supervisor_shared_dir: str = os.path.join(base_dir, "data", "shared")
+
+
+class HTTPSettings(AppSettings):
+    http2: bool = True
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 60
+    http_connect_timeout: float = 5
+    http_read_timeout: float = 20
+    http_retries: int = 2
+    http_upstream_hosts: list[str] = ["api-legacy.bubblemaps.io", "api.coingecko.com"]
+
+
+class CacheSettings(AppSettings):
+    bubblemaps_cache_size: int = 256
+    bubblemaps_cache_dir: str | None = None
+    bubblemaps_cache_disk_size: int = 2000
+    # Bubblemaps refreshes a token's map a few times a day; entries live until the
+    # next expected refresh after dt_update, but never less than the minimum TTL
+    bubblemaps_refresh_interval: float = 6 * 3600
+    bubblemaps_min_ttl: float = 300
+    # Rendered images are content-addressed, so this only bounds how long an
+    # unchanged render is reused before being produced again
+    render_cache_size: int = 1024
+    render_cache_dir: str | None = None
+    render_cache_disk_size: int = 10000
+    render_cache_ttl: float = 24 * 3600
+    # Token cards show live market data, so a card is only reused briefly even when
+    # its text is unchanged
+    card_render_cache_ttl: float = 300
+    # Telegram file_ids of sent renders, so repeat replies skip the upload; kept on
+    # disk by default, as they stay valid across restarts
+    telegram_file_id_cache_size: int = 1024
+    telegram_file_id_cache_dir: str | None = os.path.join(
+        base_dir, "data", "telegram_file_ids"
+    )
+    telegram_file_id_cache_disk_size: int = 10000
+    telegram_file_id_cache_ttl: float = 30 * 24 * 3600
+
 
+class TemplateSettings(AppSettings):
+    # None lets Jinja pick a per-user directory under the system temp dir
+    template_bytecode_cache_dir: str | None = None
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import signal
+from typing import Any
+
+from aiogram import Bot
+from aiohttp import web
+
+from logger import get_logger
+from settings import SupervisorSettings, TelegramSettings, WebhookSettings
+
+# Set up logging
+logger = get_logger()
+
+POLLING_TIMEOUT = 30
+WORKER_CHECK_INTERVAL = 5
+WORKER_STOP_TIMEOUT = 30
+
+
+def shard_key(update: dict[str, Any]) -> int:
+    """User id of the update's sender, else its chat id, else the update id."""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        if user := event.get("from"):
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+def _share_state(shared_dir: str) -> None:
+    """Point caches, the rate limiter, the sqlite session store and pre-render
+    popularity at shared files, unless configured."""
+    defaults = {
+        "BUBBLEMAPS_CACHE_DIR": os.path.join(shared_dir, "bubblemaps"),
+        "RENDER_CACHE_DIR": os.path.join(shared_dir, "renders"),
+        "COINGECKO_RATE_LIMIT_DB": os.path.join(shared_dir, "coingecko_rate_limit.db"),
+        "SESSION_DB_PATH": os.path.join(shared_dir, "sessions.db"),
+        "PRERENDER_CACHE_DIR": os.path.join(shared_dir, "prerendered"),
+        "PRERENDER_DB_PATH": os.path.join(shared_dir, "prerender.db"),
+    }
+    os.makedirs(shared_dir, exist_ok=True)
+    for name, value in defaults.items():
+        if not os.environ.get(name):
+            os.environ[name] = value
+
+
+def run_worker(index: int, updates: multiprocessing.Queue) -> None:
+    # The supervisor owns shutdown; workers stop once their queue is closed
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker_main(index, updates))
+
+
+async def _worker_main(index: int, updates: multiprocessing.Queue) -> None:
+    # Imported here so only workers load the handlers and their pools
+    from bot import create_dispatcher, telegram_settings
+
+    dp = create_dispatcher()
+    bot = Bot(token=telegram_settings.telegram_bot_token)
+    await dp.emit_startup(bot=bot)
+    logger.info(f"Worker {index} ready")
+
+    tasks: set[asyncio.Task] = set()
+    try:
+        while (update := await asyncio.to_thread(updates.get)) is not None:
+            task = asyncio.create_task(dp.feed_raw_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.wait(tasks, timeout=WORKER_STOP_TIMEOUT)
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        logger.info(f"Worker {index} stopped")
+
+
+class Supervisor:
+    """Run the bot as several worker processes behind a single update source.
+
+    Updates are received here, by polling or on the webhook, and routed to a worker
+    by user id, falling back to chat id. A user's updates therefore always reach
+    the same worker, which keeps FSM state and pending token selections consistent.
+    Each worker runs the usual Dispatcher with its own browser, HTTP and storage
+    pools. Workers share the disk caches and the CoinGecko rate limit bucket
+    through files.
+    """
+
+    def __init__(self, settings: SupervisorSettings) -> None:
+        self.settings = settings
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [
+            self._context.Queue() for _ in range(settings.supervisor_workers)
+        ]
+        self._workers: list[multiprocessing.Process | None] = [None] * len(self._queues)
+        self._stopping = asyncio.Event()
+
+    def _start_worker(self, index: int) -> None:
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._queues[index]),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._workers[index] = process
+        logger.info(f"Started worker {index} (pid {process.pid})")
+
+    def route(self, update: dict[str, Any]) -> None:
+        index = shard_key(update) % len(self._queues)
+        self._queues[index].put(update)
+
+    async def _watch_workers(self) -> None:
+        while not self._stopping.is_set():
+            for index, process in enumerate(self._workers):
+                if process is not None and not process.is_alive():
+                    logger.error(
+                        f"Worker {index} exited with code {process.exitcode}, "
+                        "restarting"
+                    )
+                    self._start_worker(index)
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=WORKER_CHECK_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, bot: Bot) -> None:
+        await bot.delete_webhook()
+        offset = None
+        while not self._stopping.is_set():
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Polling failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                self.route(
+                    update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                )
+
+    async def _serve_webhook(self, bot: Bot, settings: WebhookSettings) -> None:
+        if not settings.webhook_url:
+            raise ValueError("WEBHOOK_URL must be set when TELEGRAM_MODE is webhook")
+
+        async def handle(request: web.Request) -> web.Response:
+            secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+            if settings.webhook_secret and secret != settings.webhook_secret:
+                return web.Response(status=401)
+            self.route(await request.json())
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+        webhook_url = settings.webhook_url.rstrip("/") + settings.webhook_path
+        await bot.set_webhook(webhook_url, secret_token=settings.webhook_secret)
+        logger.info(f"Webhook registered at {webhook_url}")
+        try:
+            await self._stopping.wait()
+        finally:
+            await runner.cleanup()
+
+    async def run(self, telegram_settings: TelegramSettings) -> None:
+        _share_state(self.settings.supervisor_shared_dir)
+        for index in range(len(self._workers)):
+            self._start_worker(index)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        bot = Bot(token=telegram_settings.telegram_bot_token)
+        watcher = asyncio.create_task(self._watch_workers())
+        try:
+            if telegram_settings.telegram_mode == "webhook":
+                receiver = self._serve_webhook(bot, WebhookSettings())
+            else:
+                receiver = self._poll(bot)
+            receiver_task = asyncio.create_task(receiver)
+            stop_task = asyncio.create_task(self._stopping.wait())
+            await asyncio.wait(
+                {receiver_task, stop_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            stop_task.cancel()
+            if receiver_task.done():
+                # The receiver only returns early on error; surface it
+                receiver_task.result()
+            receiver_task.cancel()
+            await asyncio.gather(receiver_task, return_exceptions=True)
+        finally:
+            self._stopping.set()
+            await watcher
+            await bot.session.close()
+            await self._stop_workers()
+
+    async def _stop_workers(self) -> None:
+        logger.info("Stopping workers")
+        for queue in self._queues:
+            queue.put(None)
+        for index, process in enumerate(self._workers):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in time, terminating")
+                process.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(Supervisor(SupervisorSettings()).run(TelegramSettings()))
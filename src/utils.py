@@ -3,17 +3,22 @@ from __future__ import annotations
 import asyncio
 import io
 import os
+import sqlite3
 import time
+from collections import deque
+from contextlib import closing
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import httpx
 import imgkit
-from jinja2 import Environment, FileSystemLoader
-from PIL import Image
+from jinja2 import (Environment, FileSystemBytecodeCache, FileSystemLoader,
+                    Template)
 
+from http_client import http_clients
 from logger import get_logger
-from service_types import CHAIN_MAPPING, Chain, Error, error
+from service_types import (CHAIN_MAPPING, Chain, Error, RequestPriority,
+                           error)
+from settings import RateLimitSettings, TemplateSettings
 
 if TYPE_CHECKING:
     from ibm_storage import IBMStorage
@@ -46,23 +51,22 @@ def return_base_dir():
 
 
 class AsyncRequestSession:
+    """Attaches a fixed set of headers to requests made through the shared pooled
+    clients. The underlying connections outlive the session."""
+
     def __init__(self, headers: dict = None):
         self.headers = headers or {}
-        self.client = None
 
     async def __aenter__(self):
-        self.client = httpx.AsyncClient(headers=self.headers)
-        logger.info("[Session] Client created.")
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
-        await self.client.aclose()
-        logger.info("[Session] Client closed.")
+        return None
 
     async def get(self, url: str):
         logger.info(f"[Session] Sending GET request to: {url}")
         try:
-            response = await self.client.get(url)
+            response = await http_clients.get(url).get(url, headers=self.headers)
             logger.debug(f"[Session] Response status: {response.status_code}")
             return response
         except Exception as e:
@@ -70,8 +74,76 @@ class AsyncRequestSession:
             raise
 
 
+class LocalTokenBucket:
+    """Token bucket held in process memory."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def take(self) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until one is due."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class SqliteTokenBucket:
+    """Token bucket kept in a sqlite file so several bot processes share one quota."""
+
+    def __init__(self, path: str, capacity: float, rate: float):
+        self.path = path
+        self.capacity = capacity
+        self.rate = rate
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_bucket "
+                "(id INTEGER PRIMARY KEY CHECK (id = 0), tokens REAL, updated REAL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO token_bucket VALUES (0, ?, ?)",
+                (capacity, time.time()),
+            )
+
+    def _take(self) -> float:
+        with closing(
+            sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        ) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated = conn.execute(
+                "SELECT tokens, updated FROM token_bucket WHERE id = 0"
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + max(now - updated, 0) * self.rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / self.rate
+            if wait == 0:
+                tokens -= 1
+            conn.execute(
+                "UPDATE token_bucket SET tokens = ?, updated = ? WHERE id = 0",
+                (tokens, now),
+            )
+            conn.execute("COMMIT")
+            return wait
+
+    async def take(self) -> float:
+        return await asyncio.to_thread(self._take)
+
+
 class CoinGeckoRateLimiter:
-    """Strict 30 requests/minute rate limiter for CoinGecko API"""
+    """Strict 30 requests/minute rate limiter for CoinGecko API
+
+    A token bucket holding `coingecko_burst` tokens, refilled at a rate that keeps
+    any window of `coingecko_rate_period` seconds within `coingecko_rate_limit`
+    requests. Waiters are served FIFO within their priority lane, and interactive
+    lookups always go before background refreshes. Setting `coingecko_rate_limit_db`
+    moves the bucket into a sqlite file shared by every process using it.
+    """
 
     __instance = None
 
@@ -82,38 +154,53 @@ class CoinGeckoRateLimiter:
         return cls.__instance
 
     def reset(self):
-        self.request_times = []
-        self.limit = 30
-        self.period = 60  # seconds
-        self.last_burst = time.time()
-
-    async def acquire(self):
-        now = time.time()
-
-        # Remove expired requests (older than 1 minute)
-        self.request_times = [t for t in self.request_times if now - t < self.period]
-
-        # If we've hit the limit, wait until the oldest request expires
-        if len(self.request_times) >= self.limit:
-            oldest = self.request_times[0]
-            wait_time = self.period - (now - oldest)
-            await asyncio.sleep(wait_time)
-            now = time.time()  # Update time after waiting
-            self.request_times = [
-                t for t in self.request_times if now - t < self.period
-            ]
-
-        self.request_times.append(now)
-
-
-# TODO close the connection
-async def send_request(url: str):
+        settings = RateLimitSettings()
+        self.limit = settings.coingecko_rate_limit
+        self.period = settings.coingecko_rate_period
+        self.burst = max(1, min(settings.coingecko_burst, self.limit - 1))
+        rate = (self.limit - self.burst) / self.period
+        if settings.coingecko_rate_limit_db:
+            self._bucket = SqliteTokenBucket(
+                settings.coingecko_rate_limit_db, self.burst, rate
+            )
+        else:
+            self._bucket = LocalTokenBucket(self.burst, rate)
+        self._lanes = {priority: deque() for priority in RequestPriority}
+        self._dispatcher = None
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        for lane in self._lanes.values():
+            while lane and lane[0].done():
+                lane.popleft()  # Waiter was cancelled
+            if lane:
+                return lane[0]
+        return None
+
+    async def _dispatch(self):
+        while self._next_waiter() is not None:
+            wait = await self._bucket.take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            # A higher priority waiter may have arrived while taking the token
+            waiter = self._next_waiter()
+            if waiter is not None:
+                waiter.set_result(None)
+
+    async def acquire(self, priority: RequestPriority = RequestPriority.INTERACTIVE):
+        waiter = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(waiter)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await waiter
+
+
+async def send_request(url: str, headers: dict | None = None):
     logger.info(f"Sending request to: {url}")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            logger.debug(f"Received response with status code: {response.status_code}")
-            return response
+        response = await http_clients.get(url).get(url, headers=headers)
+        logger.debug(f"Received response with status code: {response.status_code}")
+        return response
     except Exception as e:
         logger.error(f"Error sending request to {url}: {str(e)}")
         raise
@@ -122,36 +209,69 @@ async def send_request(url: str):
 async def image_from_url(url) -> tuple[io.BytesIO | None, error]:
     res = await send_request(url)
     if res.status_code != 200:
-        return None, error(f"Request error: {res.json()}")
+        return None, Error(f"Request error: {res.status_code}")
     content = res.content
     if not isinstance(content, bytes):
         return None, Error("This is not a url")
     return io.BytesIO(content), None
 
 
+class TemplateRegistry:
+    """Jinja templates under static/, compiled once and kept for the process lifetime.
+
+    Compiled bytecode is also cached on disk, so restarts skip re-parsing the large
+    templates with inlined scripts.
+    """
+
+    def __init__(self, template_dir: str, bytecode_cache_dir: str | None = None):
+        self.template_dir = template_dir
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_cache_dir),
+            autoescape=True,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False,
+        )
+        # Chart payloads are inlined with tojson, so drop the whitespace
+        self.env.policies["json.dumps_kwargs"] = {
+            "sort_keys": True,
+            "separators": (",", ":"),
+        }
+        self._templates: dict[str, Template] = {}
+
+    def load_all(self) -> None:
+        for template_file in sorted(Path(self.template_dir).glob("*.html")):
+            self.get(template_file.name)
+        logger.info(f"Compiled {len(self._templates)} templates")
+
+    def get(self, template_file: str) -> Template:
+        template = self._templates.get(template_file)
+        if template is None:
+            if not (Path(self.template_dir) / template_file).exists():
+                logger.error(f"Template file not found: {template_file}")
+                raise FileNotFoundError(f"Template file not found: {template_file}")
+            template = self._templates[template_file] = self.env.get_template(
+                template_file
+            )
+            logger.debug(f"Template loaded successfully: {template_file}")
+        return template
+
+
+template_registry = TemplateRegistry(
+    os.path.join(return_base_dir(), "static"),
+    TemplateSettings().template_bytecode_cache_dir,
+)
+
+
 def render_html_template(template_path: str, **kwargs) -> str:
     logger.info(f"Rendering HTML template: {template_path}")
-    # Verify template exists
-    if not Path(template_path).exists():
-        logger.error(f"Template file not found: {template_path}")
-        raise FileNotFoundError(f"Template file not found: {template_path}")
-
-    # Set up Jinja environment
-    template_dir = str(Path(template_path).parent)
-    template_file = Path(template_path).name
-    logger.debug(f"Template directory: {template_dir}, file: {template_file}")
-
-    env = Environment(
-        loader=FileSystemLoader(template_dir),
-        autoescape=True,
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
+    template = template_registry.get(Path(template_path).name)
 
     # Render template with context
     try:
-        template = env.get_template(template_file)
-        logger.debug(f"Template loaded successfully: {template_file}")
         rendered = template.render(**kwargs)
         logger.debug("Template rendered successfully")
         return rendered
@@ -160,6 +280,11 @@ def render_html_template(template_path: str, **kwargs) -> str:
         raise
 
 
+async def render_html_template_async(template_path: str, **kwargs) -> str:
+    """render_html_template on a worker thread, for large chart_data payloads."""
+    return await asyncio.to_thread(render_html_template, template_path, **kwargs)
+
+
 def save_html_as_screenshot(
     ibm_storage: IBMStorage,
     /,
@@ -191,26 +316,6 @@ def save_html_as_screenshot(
         raise
 
 
-def reduce_image_size(image_bytes, max_size=(1024, 1024), quality=85):
-    logger.info("Size before compression %smb", len(image_bytes) * (1024**2))
-    # Open image from bytes
-    img = Image.open(io.BytesIO(image_bytes))
-
-    # Convert to RGB if necessary (e.g., for PNG or RGBA images)
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-
-    # Resize image while maintaining aspect ratio
-    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-
-    # Save to bytes with compression
-    output = io.BytesIO()
-    img.save(output, format="JPEG", quality=quality, optimize=True)
-    bytes_obj = output.getvalue()
-    logger.info("Size after compression %smb", len(bytes_obj) * (1024**2))
-    return bytes_obj
-
-
 def generate_token_description_text(token: TokenCoinData, metrics: TokenMetrics) -> str:
     """Generates descriptive text from all available token data"""
     logger.info(
@@ -65,17 +65,8 @@ function initializeVisualization(data) {
     .attr("d", "M0,-5L10,0L0,5")
     .attr("class", "arrow");
 
-  // Create a force simulation with parameters for circular arrangement
-  const simulation = d3
-    .forceSimulation(data.nodes)
-    .force("link", d3.forceLink(links).distance(200)) // Short distance for tight clustering
-    .force("charge", d3.forceManyBody().strength(-100)) // Strong repulsion for circular spread
-    .force("center", d3.forceCenter(width / 2, height / 2))
-    .force(
-      "collide",
-      d3.forceCollide((d) => radiusScale(d.amount) + 10),
-    );
-
+  // Node positions are precomputed server-side (layout.apply_layout), so the
+  // graph is drawn once with no force simulation
   // Draw nodes (bubbles)
   const node = svg
     .append("g")
@@ -86,13 +77,7 @@ function initializeVisualization(data) {
     .append("circle")
     .attr("class", "node")
     .attr("r", (d) => radiusScale(d.amount))
-    .call(
-      d3
-        .drag()
-        .on("start", dragstarted)
-        .on("drag", dragged)
-        .on("end", dragended),
-    );
+    .call(d3.drag().on("drag", dragged));
 
   // Draw links (lines between nodes) with arrows and variable thickness
   const link = svg
@@ -107,17 +92,7 @@ function initializeVisualization(data) {
       d.direction === "forward" ? "url(#arrow)" : "url(#arrow)",
     );
 
-  // Initialize node positions roughly for immediate zoom
-  data.nodes.forEach((node, i) => {
-    node.x = node.x || width / 2 + Math.cos(i) * 100;
-    node.y = node.y || height / 2 + Math.sin(i) * 100;
-  });
-
-  // Apply the default zoom immediately
-  fitGraph();
-
-  // Update positions on each tick of the simulation
-  simulation.on("tick", () => {
+  function draw() {
     link
       .attr("x1", (d) => d.source.x)
       .attr("y1", (d) => d.source.y)
@@ -125,24 +100,13 @@ function initializeVisualization(data) {
       .attr("y2", (d) => d.target.y);
 
     node.attr("cx", (d) => d.x).attr("cy", (d) => d.y);
-  });
-
-  // Drag functions
-  function dragstarted(event, d) {
-    if (!event.active) simulation.alphaTarget(0.3).restart();
-    d.fx = d.x;
-    d.fy = d.y;
   }
 
+  // Drag moves a bubble and its links directly
   function dragged(event, d) {
-    d.fx = event.x;
-    d.fy = event.y;
-  }
-
-  function dragended(event, d) {
-    if (!event.active) simulation.alphaTarget(0);
-    d.fx = null;
-    d.fy = null;
+    d.x = event.x;
+    d.y = event.y;
+    draw();
   }
 
   // Add zoom functionality
@@ -172,19 +136,16 @@ function initializeVisualization(data) {
       yMax: -Infinity,
     };
     data.nodes.forEach((node) => {
-      if (node.x && node.y) {
-        // Ensure node positions are defined
-        bounds.xMin = Math.min(bounds.xMin, node.x);
-        bounds.xMax = Math.max(bounds.xMax, node.x);
-        bounds.yMin = Math.min(bounds.yMin, node.y);
-        bounds.yMax = Math.max(bounds.yMax, node.y);
-      }
+      bounds.xMin = Math.min(bounds.xMin, node.x);
+      bounds.xMax = Math.max(bounds.xMax, node.x);
+      bounds.yMin = Math.min(bounds.yMin, node.y);
+      bounds.yMax = Math.max(bounds.yMax, node.y);
     });
 
     // Add padding and compute the scale
     const padding = 50;
-    const graphWidth = bounds.xMax - bounds.xMin;
-    const graphHeight = bounds.yMax - bounds.yMin;
+    const graphWidth = Math.max(bounds.xMax - bounds.xMin, 1);
+    const graphHeight = Math.max(bounds.yMax - bounds.yMin, 1);
     const scaleX = (width - 2 * padding) / graphWidth;
     const scaleY = (height - 2 * padding) / graphHeight;
     let scale = Math.min(scaleX, scaleY, 1);
@@ -197,17 +158,18 @@ function initializeVisualization(data) {
     const translateX = (width - graphWidth * scale) / 2 - bounds.xMin * scale;
     const translateY = (height - graphHeight * scale) / 2 - bounds.yMin * scale;
 
-    // Apply the zoom transform to the correct elements
+    // Apply the zoom transform so later zooming starts from the fitted view
     const transform = d3.zoomIdentity
       .translate(translateX, translateY)
       .scale(scale);
-    svg.selectAll(".nodes").attr("transform", transform);
-    svg.selectAll(".links").attr("transform", transform);
-
-    // Update the zoom handler to reflect this transform
-    // svg.call(zoom.transform, transform);
+    svg.call(zoom.transform, transform);
   }
-  simulation.on("end", fitGraph);
+
+  draw();
+  fitGraph();
+
+  // Headless renders wait on this flag instead of a fixed sleep
+  document.body.dataset.renderComplete = "true";
 
   // Add tooltips with name and amount
   node.on("mouseover", function (event, d) {
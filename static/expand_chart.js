@@ -0,0 +1,20 @@
+// Rebuild the row-per-node chart data from the columnar payload produced by
+// layout.compact_chart
+function expandChart(chart) {
+  const fields = Object.keys(chart.nodes);
+  const count = fields.length ? chart.nodes[fields[0]].length : 0;
+  const nodes = Array.from({ length: count }, (_, i) => {
+    const node = {};
+    fields.forEach((field) => {
+      node[field] = chart.nodes[field][i];
+    });
+    return node;
+  });
+  const links = chart.links.source.map((source, i) => ({
+    source: source,
+    target: chart.links.target[i],
+    forward: chart.links.forward[i],
+    backward: chart.links.backward[i],
+  }));
+  return { ...chart.meta, nodes: nodes, links: links };
+}
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
+
+from prerender import dump_card, load_card  # noqa: E402
+from service_types import (IdentifiedSupply, TelegramCommand,  # noqa: E402
+                           TokenCoinData, TokenCommunityData, TokenMetrics)
+
+
+class CardRoundTripTest(unittest.TestCase):
+    def test_card_survives_cache_round_trip(self):
+        card = TelegramCommand(
+            token_data=TokenCoinData(
+                symbol="tkn",
+                name="Token",
+                description="A token",
+                market_cap=1234567,
+                volume=89012,
+                price=1.23,
+                circulating_supply=1000000,
+                total_supply=2000000.5,
+                community_data=TokenCommunityData(token_image_url="https://x/t.png"),
+            ),
+            token_metrics=TokenMetrics(
+                decentralisation_score=42.5,
+                dt_update=datetime(2025, 1, 2, 3, 4, 5),
+                identified_supply=IdentifiedSupply(
+                    percent_in_cexs=0.12, percent_in_contracts=0.34
+                ),
+                status="OK",
+            ),
+            screenshot_url="https://x/card.jpg",
+            screenshot_key="abc",
+        )
+
+        restored = load_card(dump_card(card))
+
+        self.assertEqual(restored, card)
+        self.assertEqual(restored.token_data.price, 1.23)
+        self.assertEqual(restored.token_data.market_cap, 1234567)
+
+
+if __name__ == "__main__":
+    unittest.main()